@@ -0,0 +1,237 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import (
+    Integer,
+    Numeric,
+    case,
+    cast,
+    delete,
+    func,
+    literal,
+    select,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models.models import Cart, CartItem, Product
+
+
+def _insert(db, model):
+    """INSERT с поддержкой ON CONFLICT для текущей БД (SQLite или PostgreSQL)."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def upsert_cart(db, user_id):
+    """id корзины пользователя; создаёт её одним запросом, если её ещё нет."""
+    now = datetime.utcnow()
+    stmt = _insert(db, Cart).values(user_id=user_id, created_at=now, updated_at=now)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Cart.user_id],
+        set_={"updated_at": stmt.excluded.updated_at},
+    ).returning(Cart.id)
+    return db.execute(stmt).scalar_one()
+
+
+def add_item(db, cart_id, product_id, quantity):
+    """
+    Добавляет товар в корзину атомарно: новая позиция или quantity + n.
+    Возвращает (id позиции, новое количество) или None, если товара нет.
+    """
+    # строка для вставки берётся из products — несуществующий товар не добавится
+    source = select(
+        literal(cart_id), Product.id, literal(quantity), literal(datetime.utcnow())
+    ).where(Product.id == product_id)
+    stmt = _insert(db, CartItem).from_select(
+        [CartItem.cart_id, CartItem.product_id, CartItem.quantity, CartItem.added_at],
+        source,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItem.cart_id, CartItem.product_id],
+        set_={"quantity": CartItem.quantity + stmt.excluded.quantity},
+    ).returning(CartItem.id, CartItem.quantity)
+    return db.execute(stmt).first()
+
+
+def merge_items(db, cart_id, quantities):
+    """
+    Переносит гостевую корзину {product_id: quantity} в cart_items одним
+    INSERT ... SELECT ... ON CONFLICT: совпавшие товары складываются.
+    """
+    if not quantities:
+        return
+    source = select(
+        literal(cart_id),
+        Product.id,
+        case(quantities, value=Product.id),
+        literal(datetime.utcnow()),
+    ).where(Product.id.in_(list(quantities)))
+    stmt = _insert(db, CartItem).from_select(
+        [CartItem.cart_id, CartItem.product_id, CartItem.quantity, CartItem.added_at],
+        source,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItem.cart_id, CartItem.product_id],
+        set_={"quantity": CartItem.quantity + stmt.excluded.quantity},
+    )
+    db.execute(stmt)
+
+
+def _unit_cents():
+    """
+    Цена единицы со скидкой в копейках (целое число): price * (100 - d),
+    округление до целого — то же, что до копеек в гривнах. Дальше считаем
+    только целыми, поэтому суммы точные.
+    """
+    discount = case(
+        (Product.discount_percent > 100, 100),
+        (Product.discount_percent > 0, Product.discount_percent),
+        else_=0,
+    )
+    return cast(func.round(cast(Product.price * (100 - discount), Numeric)), Integer)
+
+
+def _to_money(cents):
+    """
+    Копейки -> гривны числом: считаем целыми копейками, в JSON /api/cart/*
+    отдаём число, как и раньше (фронтенд с ним считает).
+    """
+    return int(cents or 0) / 100
+
+
+def _user_cart_id(user_id):
+    return select(Cart.id).where(Cart.user_id == user_id).scalar_subquery()
+
+
+def price_cart(db, user_id):
+    """
+    Позиции корзины с ценами одним запросом (компактные строки, без товаров).
+    Суммы считаются в копейках, наружу — число гривен (до копейки).
+    """
+    unit_cents = _unit_cents()
+    rows = db.execute(
+        select(
+            CartItem.id,
+            CartItem.product_id,
+            CartItem.quantity,
+            CartItem.added_at,
+            unit_cents.label("unit_cents"),
+        )
+        .join(Product, Product.id == CartItem.product_id)
+        .where(CartItem.cart_id == _user_cart_id(user_id))
+        .order_by(CartItem.id)
+    ).all()
+
+    return _priced(
+        (r.id, r.product_id, r.quantity, r.added_at, r.unit_cents) for r in rows
+    )
+
+
+def price_guest_cart(db, quantities):
+    """
+    То же для гостевой корзины {product_id: quantity}: id позиции = id товара,
+    исчезнувшие из каталога товары пропускаются.
+    """
+    if not quantities:
+        return _priced([])
+    unit_cents = dict(
+        db.execute(
+            select(Product.id, _unit_cents()).where(Product.id.in_(list(quantities)))
+        ).all()
+    )
+    return _priced(
+        (pid, pid, qty, None, unit_cents[pid])
+        for pid, qty in quantities.items()
+        if pid in unit_cents
+    )
+
+
+def _priced(rows):
+    """rows: (id, product_id, quantity, added_at, unit_cents)."""
+    lines = []
+    total_cents = 0
+    for item_id, product_id, quantity, added_at, cents in rows:
+        total_cents += cents * quantity
+        lines.append(
+            SimpleNamespace(
+                id=item_id,
+                product_id=product_id,
+                quantity=quantity,
+                added_at=added_at,
+                unit_price=_to_money(cents),
+                subtotal=_to_money(cents * quantity),
+            )
+        )
+    return SimpleNamespace(
+        lines=lines,
+        total_items=sum(line.quantity for line in lines),
+        total_price=_to_money(total_cents),
+    )
+
+
+def cart_summary(db, user_id, item_id=None):
+    """
+    Итоги корзины одним агрегатным запросом, без загрузки товаров.
+    С item_id в ответ добавляется изменённая позиция ("item").
+    """
+    line_cents = _unit_cents() * CartItem.quantity
+    columns = [
+        func.coalesce(func.sum(CartItem.quantity), 0),
+        func.coalesce(func.sum(line_cents), 0),
+    ]
+    if item_id is not None:
+        is_item = CartItem.id == item_id
+        columns += [
+            func.max(case((is_item, CartItem.product_id))),
+            func.max(case((is_item, CartItem.quantity))),
+            func.max(case((is_item, line_cents))),
+        ]
+    row = db.execute(
+        select(*columns)
+        .select_from(CartItem)
+        .join(Product, Product.id == CartItem.product_id)
+        .where(CartItem.cart_id == _user_cart_id(user_id))
+    ).one()
+
+    summary = {"total_items": int(row[0]), "total_price": _to_money(row[1])}
+    if item_id is not None:
+        summary["item"] = {
+            "id": item_id,
+            "product_id": row[2],
+            "quantity": row[3] or 0,
+            "subtotal": _to_money(row[4]),
+        }
+    return summary
+
+
+def cart_count(db, user_id):
+    """Число товаров в корзине пользователя (значок в шапке) — один SUM."""
+    return db.execute(
+        select(func.coalesce(func.sum(CartItem.quantity), 0))
+        .select_from(CartItem)
+        .join(Product, Product.id == CartItem.product_id)
+        .where(CartItem.cart_id == _user_cart_id(user_id))
+    ).scalar_one()
+
+
+def set_item_quantity(db, user_id, item_id, quantity):
+    """Новое количество позиции пользователя; False, если позиции нет."""
+    result = db.execute(
+        update(CartItem)
+        .where(CartItem.id == item_id, CartItem.cart_id == _user_cart_id(user_id))
+        .values(quantity=quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+def remove_item(db, user_id, item_id):
+    """Удаляет позицию пользователя; False, если позиции нет."""
+    result = db.execute(
+        delete(CartItem)
+        .where(CartItem.id == item_id, CartItem.cart_id == _user_cart_id(user_id))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
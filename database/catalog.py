@@ -0,0 +1,93 @@
+from sqlalchemy import and_, or_
+
+from models.models import ProductListing
+
+PAGE_SIZE = 24
+SORTS = ("new", "price-asc", "price-desc")
+
+
+def parse_price(value):
+    """Цена из query-параметра: None для пустого/некорректного значения."""
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def encode_cursor(sort, product):
+    """Курсор keyset-пагинации: значение ключа сортировки + id последнего товара."""
+    if sort == "new":
+        return str(product.id)
+    return f"{product.sale_price!r}:{product.id}"
+
+
+def decode_cursor(sort, cursor):
+    if not cursor:
+        return None
+    try:
+        if sort == "new":
+            return (int(cursor),)
+        value, pid = cursor.rsplit(":", 1)
+        return (float(value), int(pid))
+    except (TypeError, ValueError):
+        return None
+
+
+def query_catalog(
+    db,
+    category_id=None,
+    min_price=None,
+    max_price=None,
+    sort="new",
+    cursor=None,
+    limit=PAGE_SIZE,
+):
+    """
+    Одна страница каталога с фильтрами и keyset-пагинацией по витрине
+    product_listings (без join'ов). Возвращает (listings, next_cursor);
+    next_cursor = None на последней странице.
+    """
+    if sort not in SORTS:
+        sort = "new"
+
+    q = db.query(ProductListing)
+
+    if category_id is not None:
+        q = q.filter(ProductListing.category_id == category_id)
+    if min_price is not None:
+        q = q.filter(ProductListing.sale_price >= min_price)
+    if max_price is not None:
+        q = q.filter(ProductListing.sale_price <= max_price)
+
+    after = decode_cursor(sort, cursor)
+    if sort == "new":
+        if after:
+            q = q.filter(ProductListing.id < after[0])
+        q = q.order_by(ProductListing.id.desc())
+    elif sort == "price-asc":
+        if after:
+            value, pid = after
+            q = q.filter(
+                or_(
+                    ProductListing.sale_price > value,
+                    and_(ProductListing.sale_price == value, ProductListing.id > pid),
+                )
+            )
+        q = q.order_by(ProductListing.sale_price.asc(), ProductListing.id.asc())
+    else:
+        if after:
+            value, pid = after
+            q = q.filter(
+                or_(
+                    ProductListing.sale_price < value,
+                    and_(ProductListing.sale_price == value, ProductListing.id < pid),
+                )
+            )
+        q = q.order_by(ProductListing.sale_price.desc(), ProductListing.id.desc())
+
+    rows = q.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, rows[-1])
+    return rows, next_cursor
@@ -0,0 +1,158 @@
+"""
+Версия каталога — строка catalog_state в БД, общая для всех процессов.
+Каждая транзакция, менявшая каталог, увеличивает её перед commit; процесс
+держит копию в памяти и перечитывает её не чаще раза в
+CATALOG_VERSION_CHECK_INTERVAL секунд. Кэши в памяти (главная, настройки,
+подсказки, варианты картинок) подписываются через on_catalog_change() и
+сбрасываются, когда версию поменял другой процесс.
+"""
+
+import threading
+import time
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from config import CATALOG_VERSION_CHECK_INTERVAL
+from models.models import (
+    AddOnCategory,
+    AddOnItem,
+    CatalogState,
+    Category,
+    ImageVariant,
+    Product,
+    ProductImage,
+    SiteSetting,
+)
+
+# ImageVariant — чтобы страницы получили srcset, когда фоновая задача
+# догенерирует варианты; SiteSetting — витрина главной страницы
+CATALOG_MODELS = (
+    Product,
+    Category,
+    ProductImage,
+    AddOnCategory,
+    AddOnItem,
+    ImageVariant,
+    SiteSetting,
+)
+
+# до первого чтения из БД (или без таблицы) — время запуска процесса
+_version = time.time_ns()
+_modified_at = time.time()
+_checked_at = 0.0
+_lock = threading.Lock()
+_listeners = []
+
+
+def on_catalog_change(fn):
+    """Регистрирует сброс кэша: fn() вызывается при чужом изменении каталога."""
+    _listeners.append(fn)
+    return fn
+
+
+def _notify():
+    for fn in _listeners:
+        try:
+            fn()
+        except Exception as e:
+            print("Catalog cache invalidation error:", e)
+
+
+def _set_version(version, modified_at, own_bump=False):
+    """
+    Запоминает версию. Собственный bump (+1 к известной) кэши не сбрасывает —
+    свои изменения они уже применили сами; любой другой скачок — сбрасывает.
+    """
+    global _version, _modified_at
+    with _lock:
+        if version == _version:
+            return
+        foreign = not (own_bump and version == _version + 1)
+        _version, _modified_at = version, modified_at
+    if foreign:
+        _notify()
+
+
+def refresh_catalog_version():
+    global _checked_at
+    from initdb import primary_read_engine
+
+    _checked_at = time.monotonic()
+    try:
+        with primary_read_engine.connect() as conn:
+            row = conn.execute(
+                select(CatalogState.version, CatalogState.modified_at).where(
+                    CatalogState.id == 1
+                )
+            ).first()
+    except Exception as e:
+        print("Cannot read catalog version:", e)
+        return
+    if row is not None:
+        _set_version(row.version, row.modified_at)
+
+
+def catalog_version():
+    """(версия каталога, время последнего изменения в unix-секундах)."""
+    if time.monotonic() - _checked_at >= CATALOG_VERSION_CHECK_INTERVAL:
+        refresh_catalog_version()
+    return _version, _modified_at
+
+
+def _touches_catalog(objects):
+    return any(isinstance(obj, CATALOG_MODELS) for obj in objects)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_catalog_write(session, flush_context):
+    if (
+        _touches_catalog(session.new)
+        or _touches_catalog(session.dirty)
+        or _touches_catalog(session.deleted)
+    ):
+        session.info["catalog_dirty"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_catalog_write(orm_execute_state):
+    # query(...).update()/delete() идут мимо flush
+    state = orm_execute_state
+    if state.is_insert or state.is_update or state.is_delete:
+        mapper = state.bind_mapper
+        if mapper is not None and issubclass(mapper.class_, CATALOG_MODELS):
+            state.session.info["catalog_dirty"] = True
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_in_transaction(session):
+    session.flush()
+    if not session.info.get("catalog_dirty"):
+        return
+    # строка версии меняется в той же транзакции, что и каталог
+    row = session.execute(
+        update(CatalogState)
+        .where(CatalogState.id == 1)
+        .values(version=CatalogState.version + 1, modified_at=time.time())
+        .returning(CatalogState.version, CatalogState.modified_at)
+    ).first()
+    session.info["catalog_version"] = tuple(row) if row else None
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session):
+    if session.info.pop("catalog_dirty", False):
+        row = session.info.pop("catalog_version", None)
+        if row is not None:
+            _set_version(*row, own_bump=True)
+        else:
+            # таблицы ещё нет (до миграции) — хотя бы этот процесс увидит изменение
+            _set_version(_version + 1, time.time(), own_bump=True)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop("catalog_dirty", None)
+    session.info.pop("catalog_version", None)
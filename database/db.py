@@ -1,12 +1,11 @@
-from initdb import SessionLocal
+from initdb import read_session
 from models.models import Category
 
 
-def get_all_categories():
-    """Возвращает список всех категорий из базы данных."""
-    db = SessionLocal()
-    try:
-        categories = db.query(Category).order_by(Category.name).all()
-        return categories
-    finally:
-        db.close()
+def get_all_categories(db=None):
+    """
+    Возвращает список всех категорий из базы данных.
+    Передайте сессию запроса, чтобы не брать второе соединение.
+    """
+    db = db or read_session()
+    return db.query(Category).order_by(Category.name).all()
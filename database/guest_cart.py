@@ -0,0 +1,72 @@
+from flask import after_this_request, current_app, g, request
+from itsdangerous import BadData, URLSafeSerializer
+
+# гостевая корзина живёт в своей подписанной cookie: {"product_id": qty}.
+# Не в серверной сессии — анонимные запросы не должны ходить за ней в БД
+COOKIE_NAME = "guest_cart"
+COOKIE_MAX_AGE = 30 * 24 * 3600
+# держим cookie маленькой
+MAX_LINES = 50
+MAX_QUANTITY = 999
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt="guest-cart")
+
+
+def _raw_cart():
+    if "guest_cart" in g:
+        return g.guest_cart
+    value = request.cookies.get(COOKIE_NAME)
+    if not value:
+        return {}
+    try:
+        return _serializer().loads(value)
+    except BadData:
+        return {}
+
+
+def get_guest_cart():
+    """{product_id: quantity} в порядке добавления."""
+    raw = _raw_cart()
+    try:
+        return {int(pid): int(qty) for pid, qty in raw.items() if int(qty) > 0}
+    except (AttributeError, TypeError, ValueError):
+        return {}
+
+
+def _write_cookie(response):
+    app = current_app
+    interface = app.session_interface
+    domain = interface.get_cookie_domain(app)
+    path = interface.get_cookie_path(app)
+    if g.guest_cart:
+        response.set_cookie(
+            COOKIE_NAME,
+            _serializer().dumps(g.guest_cart),
+            max_age=COOKIE_MAX_AGE,
+            httponly=True,
+            domain=domain,
+            path=path,
+            secure=interface.get_cookie_secure(app),
+            samesite=interface.get_cookie_samesite(app),
+        )
+    else:
+        response.delete_cookie(COOKIE_NAME, domain=domain, path=path)
+    return response
+
+
+def save_guest_cart(quantities):
+    """Новая корзина уходит клиенту в Set-Cookie этого же ответа."""
+    if "guest_cart" not in g:
+        after_this_request(_write_cookie)
+    g.guest_cart = {
+        str(pid): min(qty, MAX_QUANTITY) for pid, qty in quantities.items()
+    }
+
+
+def pop_guest_cart():
+    quantities = get_guest_cart()
+    if quantities:
+        save_guest_cart({})
+    return quantities
@@ -0,0 +1,115 @@
+import threading
+
+from flask import url_for
+from database.catalog_version import on_catalog_change
+from database.loaders import get_loaders
+from database.settings import get_setting
+from initdb import ReadSessionLocal
+from models.models import Category, ProductListing
+
+# собранная модель главной страницы (общая для "/" и "/services");
+# сбрасывается админскими роутами через invalidate_home_view() и при
+# изменении каталога другим процессом (on_catalog_change)
+_home_view = None
+_generation = 0
+_lock = threading.Lock()
+
+
+def category_image_url(image_path):
+    if not image_path:
+        return None
+    p = image_path.strip()
+    if p.startswith("http://") or p.startswith("https://"):
+        return p
+    return url_for("static", filename=p)
+
+
+def _build_home_view(db):
+    selected_ids = [x for x in get_setting("selected_categories") if x]
+
+    if not selected_ids:
+        product_ids = get_setting("selected_products")
+        if product_ids:
+            featured = get_loaders(db).products.load_many(product_ids)
+            seen = set()
+            for p in featured:
+                if p and p.category_id and p.category_id not in seen:
+                    seen.add(p.category_id)
+                    selected_ids.append(p.category_id)
+
+    cats = db.query(Category).all()
+    cats_by_id = {c.id: c for c in cats}
+    selected_categories = [
+        {"id": c.id, "name": c.name, "image_path": c.image_path}
+        for c in (cats_by_id[i] for i in selected_ids if i in cats_by_id)
+    ]
+
+    cats.sort(
+        key=lambda c: (
+            (c.tier if c.tier is not None else 0),
+            (c.name or "").lower(),
+        )
+    )
+    categories = [
+        {
+            "id": c.id,
+            "name": c.name,
+            "image_url": category_image_url(c.image_path),
+            "image_path": c.image_path,
+            "tier": c.tier if c.tier is not None else 0,
+        }
+        for c in cats
+    ]
+
+    products = db.query(ProductListing).order_by(ProductListing.id.desc()).all()
+    product_dicts = [
+        {
+            "id": p.id,
+            "name": p.name,
+            "description": p.description,
+            "price": p.price,
+            "category": {"id": p.category_id, "name": p.category_name},
+            "image_url": None,
+            # скрипт главной берёт только первое изображение
+            "images": [{"url": None, "path": p.first_image}] if p.first_image else [],
+        }
+        for p in products
+    ]
+
+    return {
+        "selected_categories": selected_categories,
+        "categories": categories,
+        "products": product_dicts,
+    }
+
+
+def get_home_view():
+    """Модель главной страницы; БД читается только при промахе кэша."""
+    global _home_view
+    view = _home_view
+    if view is not None:
+        return view
+    with _lock:
+        if _home_view is not None:
+            return _home_view
+        generation = _generation
+
+    db = ReadSessionLocal()
+    try:
+        view = _build_home_view(db)
+    finally:
+        db.close()
+
+    with _lock:
+        # запись, случившаяся во время сборки, делает результат устаревшим
+        if generation == _generation:
+            _home_view = view
+    return view
+
+
+@on_catalog_change
+def invalidate_home_view():
+    global _home_view, _generation
+    with _lock:
+        _home_view = None
+        _generation += 1
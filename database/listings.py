@@ -0,0 +1,136 @@
+from itertools import chain
+
+from sqlalchemy import delete, event, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from database.search import refresh_search_index
+from models.models import (
+    Category,
+    Product,
+    ProductImage,
+    ProductListing,
+    sale_price_expr,
+)
+
+_LISTING_COLUMNS = [
+    ProductListing.id,
+    ProductListing.name,
+    ProductListing.description,
+    ProductListing.price,
+    ProductListing.discount_percent,
+    ProductListing.sale_price,
+    ProductListing.category_id,
+    ProductListing.category_name,
+    ProductListing.preview,
+    ProductListing.first_image,
+    ProductListing.image_count,
+    ProductListing.created_at,
+]
+
+
+def refresh_listings(conn, product_ids=(), category_ids=(), full=False):
+    """
+    Пересобирает строки витрины для товаров и/или категорий
+    (full=True — всю витрину). conn — сессия или соединение; коммит снаружи.
+    """
+    product_ids, category_ids = list(product_ids), list(category_ids)
+    if full:
+        listing_filter = source_filter = None
+    elif product_ids or category_ids:
+        listing_filter = or_(
+            ProductListing.id.in_(product_ids),
+            ProductListing.category_id.in_(category_ids),
+        )
+        source_filter = or_(
+            Product.id.in_(product_ids), Product.category_id.in_(category_ids)
+        )
+    else:
+        return
+
+    first_image = (
+        select(ProductImage.path)
+        .where(ProductImage.product_id == Product.id)
+        .order_by(ProductImage.sort_order, ProductImage.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    image_count = (
+        select(func.count(ProductImage.id))
+        .where(ProductImage.product_id == Product.id)
+        .scalar_subquery()
+    )
+    source = select(
+        Product.id,
+        Product.name,
+        Product.description,
+        Product.price,
+        Product.discount_percent,
+        sale_price_expr,
+        Product.category_id,
+        Category.name,
+        Product.preview,
+        first_image,
+        image_count,
+        Product.created_at,
+    ).outerjoin(Category, Category.id == Product.category_id)
+
+    stmt = delete(ProductListing)
+    if source_filter is not None:
+        stmt = stmt.where(listing_filter)
+        source = source.where(source_filter)
+    conn.execute(stmt)
+    conn.execute(insert(ProductListing).from_select(_LISTING_COLUMNS, source))
+
+
+# ---- синхронизация: изменения товаров попадают в витрину и поисковый
+# индекс при commit ----
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    changed = [
+        obj
+        for obj in chain(session.new, session.dirty, session.deleted)
+        if isinstance(obj, (Product, ProductImage, Category))
+    ]
+    if not changed:
+        return
+    pending = session.info.setdefault(
+        "listings_dirty", {"products": set(), "categories": set()}
+    )
+    for obj in changed:
+        if isinstance(obj, Product):
+            pending["products"].add(obj.id)
+        elif isinstance(obj, ProductImage):
+            pending["products"].add(obj.product_id)
+        else:
+            pending["categories"].add(obj.id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_changes(orm_execute_state):
+    # массовые insert/update/delete идут мимо flush — пересобираем всё
+    state = orm_execute_state
+    if state.is_insert or state.is_update or state.is_delete:
+        mapper = state.bind_mapper
+        if mapper is not None and mapper.class_ in (Product, ProductImage, Category):
+            state.session.info["listings_full_refresh"] = True
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_before_commit(session):
+    session.flush()
+    pending = session.info.pop("listings_dirty", None)
+    full = session.info.pop("listings_full_refresh", False)
+    if full:
+        refresh_listings(session, full=True)
+        refresh_search_index(session, full=True)
+    elif pending:
+        refresh_listings(session, pending["products"], pending["categories"])
+        refresh_search_index(session, pending["products"], pending["categories"])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("listings_dirty", None)
+    session.info.pop("listings_full_refresh", None)
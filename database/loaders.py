@@ -0,0 +1,64 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from models.models import AddOnCategory, Product
+
+
+class BatchLoader:
+    """
+    Загрузка сущностей по id пачками: все недостающие ключи
+    добираются одним запросом WHERE id IN (...), результат кэшируется.
+    """
+
+    def __init__(self, db, model, options=()):
+        self.db = db
+        self.model = model
+        self.options = options
+        self._cache = {}
+
+    def load_many(self, ids):
+        """Сущности в порядке ids; для несуществующих id — None."""
+        ids = [i for i in ids if i is not None]
+        missing = {i for i in ids if i not in self._cache}
+        if missing:
+            q = self.db.query(self.model).filter(self.model.id.in_(missing))
+            if self.options:
+                q = q.options(*self.options)
+            found = {obj.id: obj for obj in q.all()}
+            for i in missing:
+                self._cache[i] = found.get(i)
+        return [self._cache[i] for i in ids]
+
+    def load(self, id_):
+        return self.load_many([id_])[0] if id_ is not None else None
+
+
+class Loaders:
+    def __init__(self, db):
+        # товары грузим вместе со всем, что нужно Product.as_dict()
+        self.products = BatchLoader(
+            db,
+            Product,
+            (
+                selectinload(Product.images),
+                joinedload(Product.category),
+                selectinload(Product.addon_categories).selectinload(
+                    AddOnCategory.items
+                ),
+            ),
+        )
+
+
+def get_loaders(db):
+    """Загрузчики живут столько же, сколько сессия, т.е. один запрос."""
+    loaders = db.info.get("loaders")
+    if loaders is None:
+        loaders = db.info["loaders"] = Loaders(db)
+    return loaders
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _reset_loaders(session):
+    # после commit/rollback объекты просрочены — кэш загрузчиков бесполезен
+    session.info.pop("loaders", None)
@@ -0,0 +1,107 @@
+"""
+Таблица login_keys: email, телефон и имя пользователя в нормализованном виде.
+Заполняется при регистрации, для старых пользователей — миграцией
+0006_login_keys. Вход — один запрос по первичному ключу, какой бы
+идентификатор ни ввёл пользователь.
+"""
+
+import re
+
+from sqlalchemy import case, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models.models import LoginKey, User
+
+def normalize_phone(phone: str) -> str:
+    if not phone:
+        return ""
+    phone = re.sub(r"[^\d+]", "", phone.strip())
+    if phone.startswith("0") and len(phone) >= 10:
+        phone = "+38" + phone
+    if re.fullmatch(r"\d{10}", phone):
+        phone = "+38" + phone
+    if phone and not phone.startswith("+"):
+        phone = "+" + phone
+    return phone
+
+
+def make_key(kind, value):
+    value = (value or "").strip()
+    if kind == "phone":
+        value = normalize_phone(value)
+    else:
+        value = value.lower()
+    return f"{kind}:{value}" if value else None
+
+
+def keys_for_user(email, phone, username):
+    keys = (
+        make_key("email", email),
+        make_key("phone", phone),
+        make_key("username", username),
+    )
+    return [k for k in keys if k]
+
+
+def candidate_keys(identifier):
+    """
+    Ключи, под которыми может лежать введённый идентификатор, по приоритету
+    (как раньше в auth.login: email или телефон, затем имя).
+    """
+    if "@" in identifier:
+        keys = [make_key("email", identifier)]
+    else:
+        keys = [make_key("phone", identifier)]
+    keys.append(make_key("username", identifier))
+    return [k for k in keys if k]
+
+
+def add_login_keys(user):
+    """Ключи нового пользователя; занятый ключ даст IntegrityError при flush."""
+    for key in keys_for_user(user.email, user.phone, user.username):
+        user.login_keys.append(LoginKey(key=key))
+
+
+def taken_kinds(db, email, phone, username):
+    """Какие из идентификаторов ("email", "phone", "username") уже заняты."""
+    keys = keys_for_user(email, phone, username)
+    taken = db.execute(select(LoginKey.key).where(LoginKey.key.in_(keys))).scalars()
+    return {key.split(":", 1)[0] for key in taken}
+
+
+def find_user(db, identifier):
+    """Пользователь по email, телефону или имени — одним запросом."""
+    keys = candidate_keys(identifier)
+    if not keys:
+        return None
+    priority = case({k: i for i, k in enumerate(keys)}, value=LoginKey.key)
+    return db.execute(
+        select(User)
+        .join(LoginKey, LoginKey.user_id == User.id)
+        .where(LoginKey.key.in_(keys))
+        .order_by(priority)
+        .limit(1)
+    ).scalar_one_or_none()
+
+
+def backfill_login_keys(conn):
+    """
+    Ключи для существующих пользователей. При совпадении нормализованных
+    значений (например, один номер в разной записи) ключ получает
+    пользователь с меньшим id — как раньше при .first().
+    """
+    rows = conn.execute(
+        select(User.id, User.email, User.phone, User.username).order_by(User.id)
+    ).all()
+    values = [
+        {"key": key, "user_id": r.id}
+        for r in rows
+        for key in keys_for_user(r.email, r.phone, r.username)
+    ]
+    if not values:
+        return
+    dialect = postgresql if conn.dialect.name == "postgresql" else sqlite
+    conn.execute(
+        dialect.insert(LoginKey).on_conflict_do_nothing(index_elements=[LoginKey.key]),
+        values,
+    )
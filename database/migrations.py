@@ -0,0 +1,222 @@
+"""
+Миграции схемы для уже существующей БД.
+
+create_all() создаёт только недостающие таблицы и не трогает старые,
+поэтому новые индексы и колонки добавляются здесь. Каждая миграция
+выполняется в своей транзакции вместе с записью в schema_migrations;
+уже применённые пропускаются. Порядок в MIGRATIONS менять нельзя,
+новые миграции дописываются в конец.
+
+    python -m database.migrations          # применить
+    python -m database.migrations status   # показать состояние
+"""
+
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    MetaData,
+    String,
+    Table,
+    delete,
+    func,
+    inspect,
+    select,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from database.listings import refresh_listings
+from database.login_keys import backfill_login_keys
+from database.search import create_search_index, refresh_search_index
+from models.models import (
+    AddOnCategory,
+    AddOnItem,
+    CartItem,
+    CatalogState,
+    Category,
+    Job,
+    Product,
+    ProductImage,
+)
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _meta,
+    Column("version", String(64), primary_key=True),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+MIGRATIONS = []
+
+
+def migration(version):
+    """Регистрирует миграцию: fn(conn)."""
+
+    def register(fn):
+        MIGRATIONS.append((version, fn))
+        return fn
+
+    return register
+
+
+# ---- операции ----
+
+
+def add_column(conn, model, name):
+    """
+    ALTER TABLE ... ADD COLUMN для колонки модели, если её ещё нет.
+    NOT NULL колонке нужен server_default, иначе старые строки не пройдут.
+    """
+    table = model.__table__
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    if name in existing:
+        return
+    ddl = CreateColumn(table.c[name]).compile(dialect=conn.dialect)
+    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+
+
+def create_index(conn, model, name):
+    """Создаёт индекс, объявленный в модели, если его ещё нет."""
+    index = next(i for i in model.__table__.indexes if i.name == name)
+    # IF NOT EXISTS: индексы по выражению не видны через reflection (checkfirst)
+    conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+# ---- миграции ----
+
+
+@migration("0001_catalog_indexes")
+def catalog_indexes(conn):
+    create_index(conn, Product, "ix_products_category_id")
+    # ix_products_sale_price здесь больше не создаётся — см. 0008
+
+
+@migration("0002_foreign_key_indexes")
+def foreign_key_indexes(conn):
+    create_index(conn, ProductImage, "ix_product_images_product_id")
+    create_index(conn, AddOnCategory, "ix_addon_categories_product_id")
+    create_index(conn, AddOnItem, "ix_addon_items_addon_category_id")
+    create_index(conn, Category, "ix_categories_tier")
+    create_index(conn, CartItem, "ix_cart_items_product_id")
+
+
+@migration("0003_cart_items_unique")
+def cart_items_unique(conn):
+    # дубли (cart_id, product_id) сливаем в одну позицию с общим количеством
+    dupes = conn.execute(
+        select(
+            CartItem.cart_id,
+            CartItem.product_id,
+            func.min(CartItem.id).label("keep_id"),
+            func.sum(CartItem.quantity).label("quantity"),
+        )
+        .group_by(CartItem.cart_id, CartItem.product_id)
+        .having(func.count() > 1)
+    ).all()
+    for d in dupes:
+        conn.execute(
+            update(CartItem)
+            .where(CartItem.id == d.keep_id)
+            .values(quantity=d.quantity)
+        )
+        conn.execute(
+            delete(CartItem).where(
+                CartItem.cart_id == d.cart_id,
+                CartItem.product_id == d.product_id,
+                CartItem.id != d.keep_id,
+            )
+        )
+    create_index(conn, CartItem, "ux_cart_items_cart_product")
+
+
+@migration("0004_product_listings")
+def product_listings(conn):
+    # таблицу создал create_all, здесь только первичное заполнение
+    refresh_listings(conn, full=True)
+
+
+@migration("0005_product_search")
+def product_search(conn):
+    create_search_index(conn)
+    refresh_search_index(conn, full=True)
+
+
+@migration("0006_login_keys")
+def login_keys(conn):
+    # таблицу создал create_all, здесь ключи для уже зарегистрированных
+    backfill_login_keys(conn)
+
+
+@migration("0007_catalog_state")
+def catalog_state(conn):
+    # таблицу создал create_all; версия стартует со времени, чтобы не совпасть
+    # с ETag'ами, которые процессы выдавали до миграции
+    exists = conn.execute(select(CatalogState.id).where(CatalogState.id == 1)).first()
+    if exists is None:
+        conn.execute(
+            CatalogState.__table__.insert().values(
+                id=1, version=time.time_ns(), modified_at=time.time()
+            )
+        )
+
+
+@migration("0008_drop_products_sale_price_index")
+def drop_products_sale_price_index(conn):
+    # сортировка по цене идёт по product_listings со своим индексом,
+    # а индекс по выражению в products только замедлял запись
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_products_sale_price")
+
+
+@migration("0009_jobs_host")
+def jobs_host(conn):
+    add_column(conn, Job, "host")
+
+
+# ---- запуск ----
+
+
+def applied_versions(engine):
+    schema_migrations.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        return {v for (v,) in conn.execute(select(schema_migrations.c.version))}
+
+
+def run_migrations(engine):
+    """Применяет недостающие миграции; возвращает список применённых."""
+    done = applied_versions(engine)
+    applied = []
+    for version, fn in MIGRATIONS:
+        if version in done:
+            continue
+        claimed = False
+        try:
+            with engine.begin() as conn:
+                # запись о версии первой: она же берёт блокировку на запись,
+                # так что параллельный процесс получит IntegrityError и пропустит
+                conn.execute(schema_migrations.insert().values(version=version))
+                claimed = True
+                fn(conn)
+        except IntegrityError:
+            if claimed:
+                raise
+            continue
+        print(f"Migration applied: {version}")
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    from initdb import engine, init_db
+
+    if sys.argv[1:] == ["status"]:
+        done = applied_versions(engine)
+        for version, _ in MIGRATIONS:
+            print("[x]" if version in done else "[ ]", version)
+    else:
+        init_db()
@@ -0,0 +1,141 @@
+"""
+Полнотекстовый поиск по товарам: виртуальная таблица SQLite FTS5
+product_search (rowid = products.id) по названию, описанию, атрибутам
+и названию категории. Индекс обновляется вместе с витриной
+product_listings в той же транзакции (см. database/listings.py).
+"""
+
+import re
+
+from sqlalchemy import column, delete, func, insert, or_, select, table, text
+
+from models.models import Category, Product, ProductListing
+
+SEARCH_PAGE_SIZE = 24
+
+# unicode61 приводит кириллицу и латиницу к нижнему регистру; апостроф —
+# часть слова («м'який»), типографские апострофы приводятся к обычному;
+# prefix — отдельные индексы для коротких префиксов (поиск по мере ввода)
+CREATE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+    "name, description, attributes, category, "
+    "tokenize = \"unicode61 remove_diacritics 2 tokenchars ''''\", "
+    "prefix = '2 3')"
+)
+# веса колонок для bm25: название важнее категории, категория — описания
+RANK = "bm25(product_search, 10.0, 1.0, 2.0, 5.0)"
+# при большем числе совпадений релевантность не считаем (см. search_products)
+RANK_LIMIT = 2000
+APOSTROPHES = ("’", "ʼ", "`")
+
+product_search = table(
+    "product_search",
+    column("rowid"),
+    column("name"),
+    column("description"),
+    column("attributes"),
+    column("category"),
+)
+
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def search_available(conn):
+    """FTS5 есть только в SQLite; conn — сессия или соединение."""
+    dialect = getattr(conn, "dialect", None) or conn.get_bind().dialect
+    return dialect.name == "sqlite"
+
+
+def create_search_index(conn):
+    if search_available(conn):
+        conn.execute(text(CREATE_FTS))
+
+
+def _normalize_sql(expr):
+    expr = func.coalesce(expr, "")
+    for a in APOSTROPHES:
+        expr = func.replace(expr, a, "'")
+    return expr
+
+
+def refresh_search_index(conn, product_ids=(), category_ids=(), full=False):
+    """Пересобирает записи индекса; аргументы как у refresh_listings()."""
+    if not search_available(conn):
+        return
+    product_ids, category_ids = list(product_ids), list(category_ids)
+    source = select(
+        Product.id,
+        _normalize_sql(Product.name),
+        _normalize_sql(Product.description),
+        _normalize_sql(Product.attributes),
+        _normalize_sql(Category.name),
+    ).outerjoin(Category, Category.id == Product.category_id)
+
+    stmt = delete(product_search)
+    if not full:
+        if not (product_ids or category_ids):
+            return
+        in_category = select(Product.id).where(Product.category_id.in_(category_ids))
+        stmt = stmt.where(
+            or_(
+                product_search.c.rowid.in_(product_ids),
+                product_search.c.rowid.in_(in_category),
+            )
+        )
+        source = source.where(
+            or_(Product.id.in_(product_ids), Product.category_id.in_(category_ids))
+        )
+    conn.execute(stmt)
+    conn.execute(insert(product_search).from_select(list(product_search.c), source))
+
+
+def to_match_query(q):
+    """
+    Строка пользователя -> запрос FTS5: каждое слово ищется по префиксу,
+    все слова обязательны. None, если искать нечего.
+    """
+    for a in APOSTROPHES:
+        q = q.replace(a, "'")
+    words = [w.strip("'") for w in _WORD_RE.findall(q.lower())]
+    words = [w for w in words if w]
+    if not words:
+        return None
+    # кавычки: слово целиком — строковый литерал, без операторов FTS
+    return " ".join(f'"{w}"*' for w in words[:10])
+
+
+def search_products(db, q, page=1, per_page=SEARCH_PAGE_SIZE):
+    """
+    Страница результатов: (listings, total). Без FTS5 (не SQLite) —
+    простой поиск по подстроке в названии.
+    """
+    page = max(1, page)
+    match = to_match_query(q or "")
+    if match is None:
+        return [], 0
+
+    stmt = select(ProductListing)
+    if search_available(db):
+        matched = text("product_search MATCH :match").bindparams(match=match)
+        total = db.execute(
+            select(func.count()).select_from(product_search).where(matched)
+        ).scalar_one()
+        stmt = stmt.join(
+            product_search, product_search.c.rowid == ProductListing.id
+        ).where(matched)
+        # bm25 считается для каждого совпадения, поэтому слишком общий запрос
+        # (пара букв) сортируем по новизне: FTS отдаёт rowid уже по порядку
+        newest = product_search.c.rowid.desc()
+        if total <= RANK_LIMIT:
+            stmt = stmt.order_by(text(RANK), newest)
+        else:
+            stmt = stmt.order_by(newest)
+    else:
+        matched = ProductListing.name.icontains(q.strip(), autoescape=True)
+        total = db.execute(
+            select(func.count()).select_from(ProductListing).where(matched)
+        ).scalar_one()
+        stmt = stmt.where(matched).order_by(ProductListing.id.desc())
+
+    rows = db.execute(stmt.offset((page - 1) * per_page).limit(per_page))
+    return rows.scalars().all(), total
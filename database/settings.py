@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database.catalog_version import on_catalog_change
+from initdb import ReadSessionLocal, SessionLocal
+from models.models import SiteSetting
+
+
+def _id_list(value, allow_empty_slots=False):
+    out = []
+    for x in value or []:
+        if x in (None, ""):
+            if allow_empty_slots:
+                out.append(None)
+            continue
+        out.append(int(x))
+    return out
+
+
+# ключ -> (значение по умолчанию, приведение типа)
+SETTINGS = {
+    # три слота витрины на главной, пустой слот — None
+    "selected_categories": ([], lambda v: _id_list(v, allow_empty_slots=True)),
+    "selected_products": ([], _id_list),
+}
+
+_cache = None
+_generation = 0
+_lock = threading.Lock()
+
+
+def _coerce(key, value):
+    default, cast = SETTINGS[key]
+    if value is None:
+        return default
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _load():
+    global _cache
+    cache = _cache
+    if cache is not None:
+        return cache
+    generation = _generation
+    db = ReadSessionLocal()
+    try:
+        rows = db.query(SiteSetting).all()
+    finally:
+        db.close()
+    loaded = {}
+    for row in rows:
+        if row.key in SETTINGS:
+            try:
+                loaded[row.key] = _coerce(row.key, json.loads(row.value))
+            except ValueError:
+                loaded[row.key] = SETTINGS[row.key][0]
+    with _lock:
+        # запись во время чтения делает загруженное устаревшим
+        if _cache is None and generation == _generation:
+            _cache = loaded
+    return loaded
+
+
+def get_setting(key):
+    """Значение настройки из кэша в памяти; БД читается только после записи."""
+    if key not in SETTINGS:
+        raise KeyError(key)
+    cache = _load()
+    if key in cache:
+        return cache[key]
+    return SETTINGS[key][0]
+
+
+def set_setting(db, key, value):
+    """Записывает настройку в рамках транзакции db; кэш сбрасывается после commit."""
+    if key not in SETTINGS:
+        raise KeyError(key)
+    db.merge(SiteSetting(key=key, value=json.dumps(_coerce(key, value))))
+    db.info["settings_dirty"] = True
+
+
+# SiteSetting входит в каталог: правка в другом процессе тоже сбрасывает кэш
+@on_catalog_change
+def invalidate_settings():
+    global _cache, _generation
+    with _lock:
+        _cache = None
+        _generation += 1
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    if session.info.pop("settings_dirty", False):
+        invalidate_settings()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("settings_dirty", None)
+
+
+def migrate_data_json(path=None):
+    """Одноразовый перенос настроек из data.json, пока таблица пустая."""
+    path = path or os.path.join(os.getcwd(), "data.json")
+    if not os.path.exists(path):
+        return
+    db = SessionLocal()
+    try:
+        if db.query(SiteSetting).first() is not None:
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print("Cannot read data.json, settings not migrated:", e)
+            return
+        for key in SETTINGS:
+            if key in data:
+                set_setting(db, key, data[key])
+        db.commit()
+        print("Settings migrated from data.json")
+    finally:
+        db.close()
@@ -1,14 +1,125 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import itertools
+import time
+
+from flask.globals import app_ctx
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
 from models.models import Base
+from database.migrations import run_migrations
+
+from config import (
+    DATABASE_REPLICA_URLS,
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    REPLICA_READ_AFTER_WRITE,
+    SQLITE_PRAGMAS,
+)
+
+DB_PATH = DATABASE_URL  # по умолчанию файл app.db в текущей папке
+# все движки процесса (в том числе хранилища сессий) — для dispose_after_fork()
+_engines = []
+
+
+def make_engine(url, readonly=False):
+    """
+    Движок с пулом под многопоточный WSGI. Для SQLite на каждое соединение
+    выставляются SQLITE_PRAGMAS; readonly-движок вдобавок запрещает запись.
+    """
+    is_sqlite = url.startswith("sqlite")
+    kwargs = {"echo": False, "future": True, "pool_pre_ping": not is_sqlite}
+    if is_sqlite:
+        # соединения ходят между потоками через пул
+        kwargs["connect_args"] = {"check_same_thread": False}
+    if not url.startswith("sqlite:///:memory:") and url != "sqlite://":
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    eng = create_engine(url, **kwargs)
+
+    if is_sqlite:
+
+        @event.listens_for(eng, "connect")
+        def set_sqlite_pragmas(dbapi_conn, connection_record):
+            cursor = dbapi_conn.cursor()
+            for name, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            if readonly:
+                cursor.execute("PRAGMA query_only=ON")
+            cursor.close()
+
+    elif readonly and eng.dialect.name == "postgresql":
+
+        @event.listens_for(eng, "connect")
+        def set_read_only(dbapi_conn, connection_record):
+            cursor = dbapi_conn.cursor()
+            cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+            cursor.close()
+            dbapi_conn.commit()
+
+    _engines.append(eng)
+    return eng
+
+
+def dispose_after_fork():
+    """
+    В дочернем процессе после fork: забыть унаследованные пулы, не закрывая
+    соединения — они принадлежат родителю.
+    """
+    for eng in _engines:
+        eng.dispose(close=False)
 
-DB_PATH = "sqlite:///./app.db"  # файл app.db в текущей папке
-engine = create_engine(DB_PATH, echo=False, future=True)
+
+# основная БД: все записи (корзина, админка, фоновые задачи)
+engine = make_engine(DB_PATH)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# чтение для публичных страниц: реплики по кругу, без реплик — основная БД
+# через отдельный пул только для чтения
+primary_read_engine = make_engine(DB_PATH, readonly=True)
+read_engines = [make_engine(url, readonly=True) for url in DATABASE_REPLICA_URLS]
+_read_cycle = itertools.cycle(read_engines or [primary_read_engine])
+_read_sessionmaker = sessionmaker(autoflush=False, autocommit=False)
+_last_write = 0.0
+
+
+@event.listens_for(engine, "commit")
+def _remember_write(conn):
+    global _last_write
+    _last_write = time.monotonic()
+
+
+def ReadSessionLocal():
+    """Сессия только для чтения; сразу после записи — с основной БД."""
+    if read_engines and time.monotonic() - _last_write < REPLICA_READ_AFTER_WRITE:
+        return _read_sessionmaker(bind=primary_read_engine)
+    return _read_sessionmaker(bind=next(_read_cycle))
+
+
+def _app_ctx_id():
+    return id(app_ctx._get_current_object())
+
+
+# сессии на время запроса: одна на контекст приложения, закрываются в teardown.
+# Фоновые задачи и скрипты по-прежнему создают SessionLocal() сами.
+db_session = scoped_session(SessionLocal, scopefunc=_app_ctx_id)
+read_session = scoped_session(ReadSessionLocal, scopefunc=_app_ctx_id)
+
+
+def init_sessions(app):
+    @app.teardown_appcontext
+    def remove_sessions(exc=None):
+        db_session.remove()
+        read_session.remove()
+
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    # create_all не меняет уже существующие таблицы — это делают миграции
+    run_migrations(engine)
     print("DB created / checked.")
 
 
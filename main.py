@@ -1,4 +1,3 @@
-import json
 import os
 from types import SimpleNamespace
 from flask import (
@@ -12,22 +11,45 @@ from flask import (
     session,
     flash,
 )
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import selectinload
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-from models.models import AddOnCategory, Cart, CartItem, Product, User, Category
-from initdb import SessionLocal, init_db
+from models.models import Product, Category
+from initdb import db_session, init_db, init_sessions, read_session
 from database.db import get_all_categories
-
-from routers.user_routes import user_reg, auth, cart_routes
+from database.cart import price_cart, price_guest_cart
+from database.catalog import parse_price, query_catalog
+from database.guest_cart import get_guest_cart
+from database.home_cache import get_home_view
+from database.loaders import get_loaders
+from database.settings import migrate_data_json
+from services.assets import init_assets
+from services.images import image_srcset
+from services.jobs import start_workers
+from services.passwords import init_password_hasher
+from services.session_store import current_profile, init_session_store
+
+from routers.user_routes import user_reg, auth, cart_routes, search_routes
 from routers.admin_routes import admin_pan, products, categories
 
 from middlewares.login import login_required
+from middlewares.page_cache import cached_page
+from middlewares.compression import init_compression
 
-from config import UPLOAD_FOLDER
+from config import SECRET_KEY, TRUSTED_PROXY_HOPS, UPLOAD_FOLDER
 
 
 app = Flask(__name__)
-app.secret_key = "Lql8aLsBzUVWvY6Ood1egDyanmTwN2GV"  # обязательно для сессий
+app.secret_key = SECRET_KEY
+if TRUSTED_PROXY_HOPS:
+    # за балансировщиком remote_addr — адрес прокси; настоящий IP клиента
+    # (для лимитов входа) берётся из X-Forwarded-For доверенных хопов
+    app.wsgi_app = ProxyFix(
+        app.wsgi_app,
+        x_for=TRUSTED_PROXY_HOPS,
+        x_proto=TRUSTED_PROXY_HOPS,
+        x_host=TRUSTED_PROXY_HOPS,
+    )
 
 app.register_blueprint(user_reg.reg_bp)
 app.register_blueprint(auth.auth)
@@ -35,6 +57,7 @@ app.register_blueprint(admin_pan.admin_bp)
 app.register_blueprint(categories.categories_bp)
 app.register_blueprint(cart_routes.cart_bp)
 app.register_blueprint(products.products_bp)
+app.register_blueprint(search_routes.search_bp)
 
 # ---- upload settings (без изменений) ----
 
@@ -43,295 +66,153 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16mb лимит на запрос
 
+app.jinja_env.globals["image_srcset"] = image_srcset
+
+# до первых соединений с БД (init_session_store, init_db) и до фоновых
+# потоков: пул процессов создаётся fork'ом
+init_password_hasher()
+
+init_sessions(app)
+init_session_store(app)
+init_assets(app)
+init_compression(app)
+
 init_db()
+migrate_data_json()
+start_workers()
 
 
 @app.route("/")
+@cached_page
 def index():
-    db = SessionLocal()
-    try:
-        data_path = os.path.join(os.getcwd(), "data.json")
-        selected_ids = []
-        selected_categories = []
-
-        if os.path.exists(data_path):
-            try:
-                with open(data_path, "r", encoding="utf-8") as f:
-                    d = json.load(f)
-            except:
-                d = {}
-
-            selected_ids = [int(x) for x in d.get("selected_categories", []) if x]
-
-            if not selected_ids:
-                product_ids = [int(x) for x in d.get("selected_products", []) if x]
-                if product_ids:
-                    products = [db.get(Product, pid) for pid in product_ids]
-                    seen = set()
-                    ordered_cat_ids = []
-                    for p in products:
-                        if p and p.category:
-                            cid = p.category.id
-                            if cid not in seen:
-                                seen.add(cid)
-                                ordered_cat_ids.append(cid)
-                    selected_ids = ordered_cat_ids
-
-        if selected_ids:
-            cats = db.query(Category).filter(Category.id.in_(selected_ids)).all()
-            cats_by_id = {c.id: c for c in cats}
-            selected_categories = [
-                cats_by_id[i] for i in selected_ids if i in cats_by_id
-            ]
-
-        cats = db.query(Category).all()
-        cats.sort(
-            key=lambda c: (
-                (c.tier if c.tier is not None else 0),
-                (c.name or "").lower(),
-            )
-        )
-        out = []
-        for c in cats:
-            img = None
-            if c.image_path:
-                p = c.image_path.strip()
-                if p.startswith("http://") or p.startswith("https://"):
-                    img = p
-                else:
-                    img = url_for("static", filename=p)
-            out.append(
-                {
-                    "id": c.id,
-                    "name": c.name,
-                    "image_url": img,
-                    "tier": c.tier if c.tier is not None else 0,
-                }
-            )
-
-        products = (
-            db.query(Product)
-            .options(joinedload(Product.images), joinedload(Product.category))
-            .order_by(Product.id.desc())
-            .all()
-        )
-
-        product_dicts = []
-        for p in products:
-            product_dicts.append(
-                {
-                    "id": p.id,
-                    "name": p.name,
-                    "description": p.description,
-                    "price": p.price,
-                    "category": {
-                        "id": p.category.id if p.category else None,
-                        "name": p.category.name if p.category else None,
-                    },
-                    "image_url": (
-                        None
-                        if not p.images
-                        else (p.images[0].url if hasattr(p.images[0], "url") else None)
-                    ),
-                    "images": [
-                        {
-                            "id": img.id,
-                            "url": getattr(img, "url", None),
-                            "path": getattr(img, "path", None),
-                        }
-                        for img in getattr(p, "images", [])
-                    ],
-                }
-            )
-
-        return render_template(
-            "index.html",
-            selected_categories=selected_categories,
-            categories=out,
-            products=product_dicts,
-        )
-    finally:
-        db.close()
+    view = get_home_view()
+    return render_template(
+        "index.html",
+        selected_categories=view["selected_categories"],
+        categories=view["categories"],
+        products=view["products"],
+    )
 
 
 @app.route("/categories")
+@cached_page
 def categories_view():
-    db = SessionLocal()
-    try:
-        cats = db.query(Category).all()
-        cats.sort(
-            key=lambda c: (
-                (c.tier if c.tier is not None else 0),
-                (c.name or "").lower(),
-            )
+    db = read_session()
+    cats = db.query(Category).all()
+    cats.sort(
+        key=lambda c: (
+            (c.tier if c.tier is not None else 0),
+            (c.name or "").lower(),
         )
-        out = []
-        for c in cats:
-            img = None
-            if c.image_path:
-                p = c.image_path.strip()
-                if p.startswith("http://") or p.startswith("https://"):
-                    img = p
-                else:
-                    img = url_for("static", filename=p)
+    )
+    out = []
+    for c in cats:
+        img = None
+        if c.image_path:
+            p = c.image_path.strip()
+            if p.startswith("http://") or p.startswith("https://"):
+                img = p
             else:
-                img = None
-            out.append(
-                {
-                    "id": c.id,
-                    "name": c.name,
-                    "image_url": img,
-                    "tier": c.tier if c.tier is not None else 0,
-                }
-            )
-        return render_template("categories.html", categories=out)
-    finally:
-        db.close()
+                img = url_for("static", filename=p)
+        else:
+            img = None
+        out.append(
+            {
+                "id": c.id,
+                "name": c.name,
+                "image_url": img,
+                "image_path": c.image_path,
+                "tier": c.tier if c.tier is not None else 0,
+            }
+        )
+    return render_template("categories.html", categories=out)
 
 
 @app.route("/shop")
+@cached_page
 def shop():
-    db = SessionLocal()
-    try:
-        selected_category = request.args.get("category", "all")
-
-        # загружаем продукты с предзагрузкой связей чтобы избежать N+1
-        products = (
-            db.query(Product)
-            .options(joinedload(Product.images), joinedload(Product.category))
-            .order_by(Product.id.desc())
-            .all()
+    db = read_session()
+    selected_category = request.args.get("category", "all")
+    min_price = parse_price(request.args.get("min_price"))
+    max_price = parse_price(request.args.get("max_price"))
+    sort = request.args.get("sort", "new")
+    cursor = request.args.get("cursor")
+
+    categories = get_all_categories(db)
+
+    # категорию в ссылках передают по имени в нижнем регистре
+    category_id = None
+    if selected_category != "all":
+        category_id = next(
+            (c.id for c in categories if c.name.lower() == selected_category),
+            -1,
         )
 
-        categories = get_all_categories()
-
-        return render_template(
-            "shop.html",
-            products=products,
-            categories=categories,
-            selected_category=selected_category,
-        )
-    finally:
-        db.close()
+    products, next_cursor = query_catalog(
+        db,
+        category_id=category_id,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+        cursor=cursor,
+    )
+
+    return render_template(
+        "shop.html",
+        products=products,
+        categories=categories,
+        selected_category=selected_category,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+        cursor=cursor,
+        next_cursor=next_cursor,
+    )
 
 
 @app.route("/product/<int:product_id>")
+@cached_page
 def product_info(product_id):
-    db = SessionLocal()
-    try:
-        product = (
-            db.query(Product)
-            .options(
-                joinedload(Product.images),
-                joinedload(Product.category),
-                joinedload(Product.addon_categories).joinedload(AddOnCategory.items),
-            )
-            .get(product_id)
-        )
-        if not product:
-            flash("Товар не знайдено", "error")
-            return redirect(url_for("shop"))
-        return render_template("product_info.html", product=product)
-    finally:
-        db.close()
+    db = read_session()
+    product = get_loaders(db).products.load(product_id)
+    if not product:
+        flash("Товар не знайдено", "error")
+        return redirect(url_for("shop"))
+    return render_template("product_info.html", product=product)
 
 
 @app.route("/about")
+@cached_page
 def about():
     return render_template("about.html")
 
 
 @app.route("/services")
+@cached_page
 def services():
-    db = SessionLocal()
-    try:
-        data_path = os.path.join(os.getcwd(), "data.json")
-        selected_ids = []
-        selected_categories = []
-
-        if os.path.exists(data_path):
-            try:
-                with open(data_path, "r", encoding="utf-8") as f:
-                    d = json.load(f)
-            except:
-                d = {}
-
-            selected_ids = [int(x) for x in d.get("selected_categories", []) if x]
-
-            if not selected_ids:
-                product_ids = [int(x) for x in d.get("selected_products", []) if x]
-                if product_ids:
-                    products = [db.get(Product, pid) for pid in product_ids]
-                    seen = set()
-                    ordered_cat_ids = []
-                    for p in products:
-                        if p and p.category:
-                            cid = p.category.id
-                            if cid not in seen:
-                                seen.add(cid)
-                                ordered_cat_ids.append(cid)
-                    selected_ids = ordered_cat_ids
-
-        if selected_ids:
-            cats = db.query(Category).filter(Category.id.in_(selected_ids)).all()
-            cats_by_id = {c.id: c for c in cats}
-            selected_categories = [
-                cats_by_id[i] for i in selected_ids if i in cats_by_id
-            ]
-
-        cats = db.query(Category).all()
-        cats.sort(
-            key=lambda c: (
-                (c.tier if c.tier is not None else 0),
-                (c.name or "").lower(),
-            )
-        )
-        out = []
-        for c in cats:
-            img = None
-            if c.image_path:
-                p = c.image_path.strip()
-                if p.startswith("http://") or p.startswith("https://"):
-                    img = p
-                else:
-                    img = url_for("static", filename=p)
-            out.append(
-                {
-                    "id": c.id,
-                    "name": c.name,
-                    "image_url": img,
-                    "tier": c.tier if c.tier is not None else 0,
-                }
-            )
-
-        products = (
-            db.query(Product)
-            .options(joinedload(Product.images), joinedload(Product.category))
-            .order_by(Product.id.desc())
-            .all()
-        )
-
-        return render_template(
-            "services.html",
-            selected_categories=selected_categories,
-            categories=out,
-            products=products,
-        )
-    finally:
-        db.close()
+    view = get_home_view()
+    return render_template(
+        "services.html",
+        selected_categories=view["selected_categories"],
+        categories=view["categories"],
+        products=view["products"],
+    )
 
 
 @app.route("/guarantee")
+@cached_page
 def guarantee():
     return render_template("guarantee.html")
 
 
 @app.route("/contact")
+@cached_page
 def contact():
     return render_template("contact.html")
 
 
 @app.route("/terms")
+@cached_page
 def terms():
     return render_template("user_agreement.html")
 
@@ -339,59 +220,51 @@ def terms():
 @app.route("/profile")
 @login_required
 def profile():
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.id == session["user_id"]).first()
-        if not user:
-            session.clear()
-            return redirect(url_for("auth.login"))
+    # профиль берётся из снимка в сессии, без запроса к users
+    user = current_profile()
+    if not user:
+        session.clear()
+        return redirect(url_for("auth.login"))
 
-        return render_template("profile.html", user=user)
-    finally:
-        db.close()
+    return render_template("profile.html", user=user)
 
 
 @app.route("/cart")
-@login_required
 def cart():
-    db = SessionLocal()
-    try:
-        user_id = session["user_id"]
-
-        # получаем корзину пользователя с товарами
-        cart_obj = (
-            db.query(Cart)
-            .options(
-                joinedload(Cart.items)
-                .joinedload(CartItem.product)
-                .joinedload(Product.images)
-            )
-            .filter(Cart.user_id == user_id)
-            .first()
-        )
+    # цены и итоги считает SQL (точно, в копейках); товары для картинок и
+    # названий — одним запросом, сколько бы позиций ни было.
+    # У гостя корзина в cookie, из БД читается только каталог.
+    user_id = session.get("user_id")
+    if user_id is None:
+        db = read_session()
+        priced = price_guest_cart(db, get_guest_cart())
+    else:
+        db = db_session()
+        priced = price_cart(db, user_id)
+    products = {
+        p.id: p
+        for p in db.query(Product)
+        .options(selectinload(Product.images))
+        .filter(Product.id.in_([line.product_id for line in priced.lines]))
+    }
 
-        if not cart_obj:
-            cart_data = SimpleNamespace(items=[], total_price=0.0, total_items=0)
-        else:
-            items_list = list(cart_obj.items)
-            try:
-                total_price = float(cart_obj.total_price())
-            except Exception:
-                total_price = 0.0
-            try:
-                total_items = int(cart_obj.total_items())
-            except Exception:
-                total_items = len(items_list)
-
-            cart_data = SimpleNamespace(
-                items=items_list,
-                total_price=total_price,
-                total_items=total_items,
-            )
-
-        return render_template("cart.html", cart=cart_data)
-    finally:
-        db.close()
+    items = [
+        SimpleNamespace(
+            id=line.id,
+            product=products[line.product_id],
+            quantity=line.quantity,
+            unit_price=line.unit_price,
+            subtotal=line.subtotal,
+        )
+        for line in priced.lines
+    ]
+    cart_data = SimpleNamespace(
+        items=items,
+        total_price=priced.total_price,
+        total_items=priced.total_items,
+    )
+
+    return render_template("cart.html", cart=cart_data)
 
 
 @app.route("/forgot-password")
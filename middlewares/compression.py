@@ -0,0 +1,82 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # без brotli сжимаем только gzip
+    brotli = None
+
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # для ответов на лету; статику сжимаем сильнее при сборке
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding():
+    """Лучшая поддерживаемая клиентом кодировка или None."""
+    accepted = request.accept_encodings
+    for encoding in available_encodings():
+        if accepted[encoding]:
+            return encoding
+    return None
+
+
+def compress(data, encoding, quality=None):
+    if encoding == "br":
+        return brotli.compress(
+            data, quality=BROTLI_QUALITY if quality is None else quality
+        )
+    return gzip.compress(data, compresslevel=GZIP_LEVEL if quality is None else quality)
+
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def encoded_etag(etag, encoding):
+    """Разные кодировки — разные представления, им нужны разные ETag."""
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def compress_response(response):
+    """after_request: сжимает динамические ответы, если клиент это поддерживает."""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or not is_compressible(response.mimetype)
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(encoded_etag(etag, encoding), weak=weak)
+    return response
+
+
+def init_compression(app):
+    app.after_request(compress_response)
@@ -1,5 +1,8 @@
+import math
 from functools import wraps
-from flask import jsonify, request, session, redirect, url_for
+from flask import jsonify, make_response, render_template, request, session, redirect, url_for
+
+from middlewares.rate_limit import check_attempt
 
 
 def login_required(f):
@@ -20,3 +23,29 @@ def api_login_required(f):
         return f(*args, **kwargs)
 
     return decorated
+
+
+def rate_limited(template, identifier_field=None):
+    """
+    Ограничивает POST-попытки (token bucket на IP и на значение поля формы
+    identifier_field). Отказ — 429 со страницей template, до БД и хэширования
+    пароля запрос не доходит.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if request.method == "POST":
+                identifier = request.form.get(identifier_field) if identifier_field else None
+                wait = check_attempt(request.endpoint, request.remote_addr, identifier)
+                if wait:
+                    seconds = math.ceil(wait)
+                    error = f"Забагато спроб. Спробуйте через {seconds} с."
+                    resp = make_response(render_template(template, error=error), 429)
+                    resp.headers["Retry-After"] = str(seconds)
+                    return resp
+            return f(*args, **kwargs)
+
+        return decorated
+
+    return decorator
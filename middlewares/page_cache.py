@@ -0,0 +1,120 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request, session
+
+from database.catalog_version import catalog_version, on_catalog_change
+from middlewares.compression import (
+    MIN_SIZE,
+    compress,
+    encoded_etag,
+    is_compressible,
+    negotiate_encoding,
+)
+from services.assets import deploy_token
+
+MAX_ENTRIES = 512
+
+# кэш отрендеренных публичных страниц:
+# ключ -> (версия каталога, {кодировка: body}, mimetype); None — без сжатия
+_pages = OrderedDict()
+_lock = threading.Lock()
+
+
+def _make_etag(version, key):
+    # отпечаток выкладки: новые шаблоны/статика — новый ETag при той же версии каталога
+    token = deploy_token()[0]
+    return hashlib.sha1(f"{token}:{version}:{key}".encode("utf-8")).hexdigest()
+
+
+def _get(key, version):
+    with _lock:
+        entry = _pages.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        _pages.move_to_end(key)
+        return entry
+
+
+def _put(key, entry):
+    with _lock:
+        _pages[key] = entry
+        _pages.move_to_end(key)
+        while len(_pages) > MAX_ENTRIES:
+            _pages.popitem(last=False)
+
+
+def _encoded_body(entry, encoding):
+    """Сжатое тело кэшируется рядом с исходным, чтобы не сжимать на каждый запрос."""
+    bodies = entry[1]
+    body = bodies.get(encoding)
+    if body is None:
+        body = compress(bodies[None], encoding)
+        with _lock:
+            bodies[encoding] = body
+    return body
+
+
+# записи старой версии всё равно не отдаются — освобождаем память сразу
+@on_catalog_change
+def clear_page_cache():
+    with _lock:
+        _pages.clear()
+
+
+def cached_page(f):
+    """
+    Кэширует публичную страницу целиком и отдаёт ETag/Last-Modified.
+    ETag зависит от версии каталога и выкладки, поэтому на If-None-Match отвечаем 304
+    без рендера. Ответы, читавшие сессию, в общий кэш не попадают.
+    Сжатые (br/gzip) версии тела хранятся в той же записи кэша.
+    """
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return f(*args, **kwargs)
+
+        version, modified_at = catalog_version()
+        key = request.full_path
+        etag = _make_etag(version, key)
+        encoding = negotiate_encoding()
+        # клиент мог закэшировать и сжатое, и несжатое представление
+        matched = next(
+            (
+                e
+                for e in (etag, encoded_etag(etag, encoding))
+                if e in request.if_none_match
+            ),
+            None,
+        )
+
+        entry = _get(key, version)
+        if entry is None and matched is None:
+            rv = make_response(f(*args, **kwargs))
+            if rv.status_code != 200 or session.accessed:
+                return rv
+            entry = (version, {None: rv.get_data()}, rv.mimetype)
+            _put(key, entry)
+
+        if entry is None:
+            resp = make_response("", 304)
+            resp.set_etag(matched)
+        else:
+            raw = entry[1][None]
+            if encoding and (len(raw) < MIN_SIZE or not is_compressible(entry[2])):
+                encoding = None
+            resp = make_response(_encoded_body(entry, encoding) if encoding else raw)
+            resp.mimetype = entry[2]
+            if encoding:
+                resp.headers["Content-Encoding"] = encoding
+            resp.set_etag(encoded_etag(etag, encoding))
+        resp.vary.add("Accept-Encoding")
+        resp.last_modified = max(modified_at, deploy_token()[1])
+        resp.cache_control.public = True
+        resp.cache_control.no_cache = True
+        return resp.make_conditional(request)
+
+    return decorated
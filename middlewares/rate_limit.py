@@ -0,0 +1,85 @@
+"""
+Token bucket для входа и регистрации: отдельные вёдра на IP и на
+идентификатор (email/телефон/логин). Вёдра — в OrderedDict с вытеснением
+самых давних (LRU), в памяти процесса. Декоратор — rate_limited в
+middlewares/login.py.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from config import RATE_LIMIT_MAX_KEYS, RATE_LIMIT_PER_IDENTIFIER, RATE_LIMIT_PER_IP
+from database.login_keys import normalize_phone
+
+
+class TokenBuckets:
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # ключ -> [токены, время последнего пополнения]
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refill(self, key, capacity, rate, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return [float(capacity), now]
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        return bucket
+
+    def take(self, limits):
+        """
+        limits: [(ключ, ёмкость, токенов/с)]. Токен списывается из всех вёдер
+        сразу или ни из одного. Возвращает 0, если можно, иначе секунды до
+        следующей попытки.
+        """
+        now = time.monotonic()
+        with self._lock:
+            buckets = [
+                (key, self._refill(key, capacity, rate, now), rate)
+                for key, capacity, rate in limits
+            ]
+            wait = max(
+                ((1 - b[0]) / rate for _, b, rate in buckets if b[0] < 1), default=0
+            )
+            for key, bucket, _ in buckets:
+                if not wait:
+                    bucket[0] -= 1
+                self._buckets[key] = bucket
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+_buckets = TokenBuckets()
+
+
+def identifier_key(value):
+    """Одинаковый ключ для разных записей одного телефона/email."""
+    value = (value or "").strip().lower()
+    if not value:
+        return None
+    if "@" not in value:
+        phone = normalize_phone(value)
+        if len(phone) >= 11:
+            return "phone:" + phone
+    return "id:" + value
+
+
+def check_attempt(scope, ip, identifier=None):
+    """Списывает попытку; 0 — можно, иначе секунды до следующей попытки."""
+    limits = [(f"{scope}:ip:{ip}", *RATE_LIMIT_PER_IP)]
+    key = identifier_key(identifier)
+    if key:
+        limits.append((f"{scope}:{key}", *RATE_LIMIT_PER_IDENTIFIER))
+    return _buckets.take(limits)
+
+
+def reset_rate_limits():
+    _buckets.clear()
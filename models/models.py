@@ -1,5 +1,6 @@
 from datetime import datetime
 from sqlalchemy import (
+    BigInteger,
     Column,
     Integer,
     String,
@@ -7,6 +8,8 @@ from sqlalchemy import (
     Text,
     DateTime,
     ForeignKey,
+    Index,
+    literal_column,
 )
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -19,7 +22,7 @@ class Category(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(150), unique=True, nullable=False)
     image_path = Column(String(512), nullable=True)
-    tier = Column(Integer)
+    tier = Column(Integer, index=True)
 
     products = relationship(
         "Product", back_populates="category", cascade="all, delete-orphan"
@@ -78,11 +81,50 @@ class Product(Base):
         return f"<Product(id={self.id}, name={self.name!r}, price={self.price})>"
 
 
+# цена со скидкой на стороне SQL (заполняет product_listings.sale_price)
+sale_price_expr = Product.price * (
+    literal_column("1") - Product.discount_percent / literal_column("100.0")
+)
+
+Index("ix_products_category_id", Product.category_id, Product.id)
+
+
+class ProductListing(Base):
+    """
+    Витрина для списков товаров: одна узкая строка на товар, без join'ов.
+    Пересобирается из products/categories/product_images в той же
+    транзакции, что и изменение (см. database/listings.py).
+    """
+
+    __tablename__ = "product_listings"
+
+    id = Column(Integer, primary_key=True)  # = products.id
+    name = Column(String(255), nullable=False)
+    description = Column(Text, default="")
+    price = Column(Float, nullable=False)
+    discount_percent = Column(Float, nullable=False, default=0.0)
+    sale_price = Column(Float, nullable=False)
+    category_id = Column(Integer, nullable=True)
+    category_name = Column(String(150), nullable=True)
+    preview = Column(String(512), nullable=True)
+    first_image = Column(String(512), nullable=True)
+    image_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_product_listings_category_id", "category_id", "id"),
+        Index("ix_product_listings_sale_price", "sale_price", "id"),
+    )
+
+    def __repr__(self):
+        return f"<ProductListing(id={self.id}, name={self.name!r}, sale_price={self.sale_price})>"
+
+
 class ProductImage(Base):
     __tablename__ = "product_images"
 
     id = Column(Integer, primary_key=True)
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
     path = Column(String(512), nullable=False)
     sort_order = Column(Integer, default=0)
 
@@ -96,7 +138,7 @@ class AddOnCategory(Base):
     __tablename__ = "addon_categories"
 
     id = Column(Integer, primary_key=True)
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
     name = Column(String(255), nullable=False)
     price = Column(Float, default=0.0, nullable=False)
 
@@ -122,7 +164,7 @@ class AddOnItem(Base):
 
     id = Column(Integer, primary_key=True)
     addon_category_id = Column(
-        Integer, ForeignKey("addon_categories.id"), nullable=False
+        Integer, ForeignKey("addon_categories.id"), nullable=False, index=True
     )
     name = Column(String(255), nullable=False)
     image_path = Column(String(512), nullable=True)
@@ -153,11 +195,28 @@ class User(Base):
     cart = relationship(
         "Cart", back_populates="user", uselist=False, cascade="all, delete-orphan"
     )
+    login_keys = relationship("LoginKey", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<User(id={self.id}, username={self.username!r}, phone={self.phone!r})>"
 
 
+class LoginKey(Base):
+    """
+    Нормализованные идентификаторы для входа ("email:...", "phone:+380...",
+    "username:..."): пользователь находится одним поиском по первичному ключу.
+    См. database/login_keys.py.
+    """
+
+    __tablename__ = "login_keys"
+
+    key = Column(String(300), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<LoginKey(key={self.key!r}, user_id={self.user_id})>"
+
+
 class Cart(Base):
     __tablename__ = "carts"
 
@@ -186,7 +245,7 @@ class CartItem(Base):
 
     id = Column(Integer, primary_key=True)
     cart_id = Column(Integer, ForeignKey("carts.id"), nullable=False)
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
     quantity = Column(Integer, default=1, nullable=False)
     added_at = Column(DateTime, default=datetime.utcnow)
 
@@ -205,5 +264,127 @@ class CartItem(Base):
             "added_at": self.added_at.isoformat() if self.added_at else None,
         }
 
+    # одна позиция на товар в корзине; заодно индекс для поиска по cart_id
+    __table_args__ = (
+        Index("ux_cart_items_cart_product", "cart_id", "product_id", unique=True),
+    )
+
     def __repr__(self):
         return f"<CartItem(id={self.id}, product_id={self.product_id}, quantity={self.quantity})>"
+
+
+class ImageVariant(Base):
+    __tablename__ = "image_variants"
+
+    id = Column(Integer, primary_key=True)
+    # путь оригинала относительно static/, например "uploads/img_x.jpg"
+    source_path = Column(String(512), nullable=False, index=True)
+    width = Column(Integer, nullable=False)
+    format = Column(String(10), nullable=False)
+    path = Column(String(512), nullable=False)
+
+    def __repr__(self):
+        return f"<ImageVariant(source={self.source_path!r}, width={self.width}, format={self.format!r})>"
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(64), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")
+    # queued -> running -> done / failed
+    status = Column(String(16), nullable=False, default="queued", index=True)
+    # хост, которому принадлежит задача (нужны его локальные файлы); None — любой
+    host = Column(String(255), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "host": self.host,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def __repr__(self):
+        return f"<Job(id={self.id}, kind={self.kind!r}, status={self.status!r})>"
+
+
+class StoredFile(Base):
+    """Загруженный файл в контентно-адресуемом хранилище (uploads/cas/)."""
+
+    __tablename__ = "stored_files"
+
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), unique=True, nullable=False)
+    # путь относительно static/, например "uploads/cas/ab/ab12...ef.jpg"
+    path = Column(String(512), unique=True, nullable=False)
+    size = Column(Integer, nullable=False, default=0)
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<StoredFile(sha256={self.sha256[:12]!r}, refcount={self.refcount})>"
+
+
+class SiteSetting(Base):
+    __tablename__ = "site_settings"
+
+    key = Column(String(64), primary_key=True)
+    value = Column(Text, nullable=False, default="null")  # JSON
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SiteSetting(key={self.key!r}, value={self.value!r})>"
+
+
+class CatalogState(Base):
+    """
+    Одна строка (id=1): версия каталога, общая для всех процессов.
+    Увеличивается в той же транзакции, что и изменение каталога
+    (см. database/catalog_version.py).
+    """
+
+    __tablename__ = "catalog_state"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False)
+    modified_at = Column(Float, nullable=False)  # unix-секунды
+
+    def __repr__(self):
+        return f"<CatalogState(version={self.version})>"
+
+
+class SessionEntry(Base):
+    """Данные серверной сессии (services/session_store.py, SqlStore)."""
+
+    __tablename__ = "session_entries"
+
+    key = Column(String(128), primary_key=True)
+    value = Column(Text, nullable=False)
+    expires_at = Column(Float, nullable=True, index=True)  # unix-секунды
+
+    def __repr__(self):
+        return f"<SessionEntry(key={self.key!r})>"
+
+
+class SessionMember(Base):
+    """Элемент множества в хранилище сессий (список сессий пользователя)."""
+
+    __tablename__ = "session_members"
+
+    key = Column(String(128), primary_key=True)
+    member = Column(String(128), primary_key=True)
+    expires_at = Column(Float, nullable=True, index=True)  # unix-секунды
+
+    def __repr__(self):
+        return f"<SessionMember(key={self.key!r}, member={self.member!r})>"
@@ -1,6 +1,4 @@
-import json
-import os
-from flask import Blueprint, app, flash, render_template, request, redirect, url_for
+from flask import Blueprint, app, flash, jsonify, render_template, request, redirect, url_for
 from flask import (
     render_template,
     redirect,
@@ -8,10 +6,12 @@ from flask import (
     session,
 )
 
-from initdb import SessionLocal
-from sqlalchemy.orm import joinedload
-from models.models import Category, Product
+from initdb import db_session
+from models.models import Category, Job, ProductListing
 from database.db import get_all_categories
+from database.home_cache import invalidate_home_view
+from database.settings import get_setting, set_setting
+from middlewares.login import rate_limited
 
 admin_bp = Blueprint("admin", __name__, template_folder="../templates")
 
@@ -26,37 +26,31 @@ def admin_products():
     if not session.get("admin_logged_in"):
         return redirect(url_for("admin.admin_login"))
 
-    categories = get_all_categories()
-    db = SessionLocal()
-    try:
-        products = (
-            db.query(Product)
-            .options(joinedload(Product.category))
-            .order_by(Product.id.desc())
-            .all()
-        )
-
-        # DEBUG: проверка
-        for p in products:
-            if p.id is None:
-                print(f"WARNING: Product without ID: {p.name}")
-
-        return render_template(
-            "admin-products.html",
-            products=products,
-            categories=categories,
-        )
-    finally:
-        db.close()
+    db = db_session()
+    categories = get_all_categories(db)
+    products = db.query(ProductListing).order_by(ProductListing.id.desc()).all()
+
+    # DEBUG: проверка
+    for p in products:
+        if p.id is None:
+            print(f"WARNING: Product without ID: {p.name}")
+
+    return render_template(
+        "admin-products.html",
+        products=products,
+        categories=categories,
+    )
 
 
 @admin_bp.route("/admin-login", methods=["GET", "POST"])
+@rate_limited("admin-login.html", identifier_field="username")
 def admin_login():
     if request.method == "POST":
         username = request.form.get("username")
         password = request.form.get("password")
 
         if username == "admin" and password == "1234":
+            session.regenerate()  # новый id сессии после входа
             session["admin_logged_in"] = True
             return redirect(url_for("admin.admin_panel"))
         else:
@@ -71,52 +65,64 @@ def admin_panel():
     if not session.get("admin_logged_in"):
         return redirect(url_for("admin.admin_login"))
 
-    db = SessionLocal()
-    try:
-        categories = db.query(Category).order_by(Category.name).all()
-        # Передаём и имя, и путь к изображению
-        category_data = [
-            {"name": c.name, "image_path": c.image_path, "tier": c.tier}
-            for c in categories
-        ]
-    finally:
-        db.close()
+    db = db_session()
+    categories = db.query(Category).order_by(Category.name).all()
+    # Передаём и имя, и путь к изображению
+    category_data = [
+        {"name": c.name, "image_path": c.image_path, "tier": c.tier}
+        for c in categories
+    ]
 
     return render_template("admin-panel.html", categories=category_data)
 
 
 @admin_bp.route("/admin_settings", methods=["GET", "POST"])
 def admin_settings():
-    db = SessionLocal()
-    try:
-        categories = db.query(Category).order_by(Category.id.desc()).all()
-
-        saved_selected = None
-        data_path = os.path.join(os.getcwd(), "data.json")
-        if os.path.exists(data_path):
-            try:
-                with open(data_path, "r", encoding="utf-8") as f:
-                    d = json.load(f)
-                    saved_selected = d.get("selected_categories")
-            except:
-                saved_selected = None
-
-        if request.method == "POST":
-            c1 = request.form.get("category_1") or None
-            c2 = request.form.get("category_2") or None
-            c3 = request.form.get("category_3") or None
-            selected = [c1, c2, c3]
-            data = {"selected_categories": [int(x) if x else None for x in selected]}
-            with open(data_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            return redirect(url_for("admin.admin_settings", saved=1))
-
-        saved = request.args.get("saved") is not None
-        return render_template(
-            "admin_settings.html",
-            categories=categories,
-            saved=saved,
-            selected=saved_selected,
-        )
-    finally:
-        db.close()
+    db = db_session()
+    categories = db.query(Category).order_by(Category.id.desc()).all()
+
+    saved_selected = get_setting("selected_categories")
+
+    if request.method == "POST":
+        c1 = request.form.get("category_1") or None
+        c2 = request.form.get("category_2") or None
+        c3 = request.form.get("category_3") or None
+        set_setting(db, "selected_categories", [c1, c2, c3])
+        db.commit()
+        invalidate_home_view()
+        return redirect(url_for("admin.admin_settings", saved=1))
+
+    saved = request.args.get("saved") is not None
+    return render_template(
+        "admin_settings.html",
+        categories=categories,
+        saved=saved,
+        selected=saved_selected,
+    )
+
+
+@admin_bp.route("/admin-jobs")
+def admin_jobs():
+    """Последние фоновые задачи (обработка загрузок и т.п.)."""
+    if not session.get("admin_logged_in"):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    db = db_session()
+    q = db.query(Job)
+    status = request.args.get("status")
+    if status:
+        q = q.filter(Job.status == status)
+    jobs = q.order_by(Job.id.desc()).limit(50).all()
+    return jsonify({"jobs": [j.as_dict() for j in jobs]})
+
+
+@admin_bp.route("/admin-jobs/<int:job_id>")
+def admin_job_status(job_id):
+    if not session.get("admin_logged_in"):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    db = db_session()
+    job = db.get(Job, job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.as_dict())
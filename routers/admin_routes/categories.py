@@ -1,5 +1,4 @@
 import os
-from uuid import uuid4
 from flask import (
     Blueprint,
     jsonify,
@@ -7,11 +6,12 @@ from flask import (
     url_for,
 )
 from flask import session
-from werkzeug.utils import secure_filename
 
 from config import BASE_DIR
-from initdb import SessionLocal
+from initdb import db_session
 from models.models import Category, Product, ProductImage
+from database.home_cache import invalidate_home_view
+from services.uploads import store_upload
 
 categories_bp = Blueprint("categories", __name__, template_folder="../templates")
 
@@ -32,7 +32,7 @@ def add_category():
     if not name:
         return jsonify({"error": "empty name"}), 400
 
-    db = SessionLocal()
+    db = db_session()
     try:
         # проверим на существование
         exists = db.query(Category).filter(Category.name == name).first()
@@ -45,6 +45,7 @@ def add_category():
         new_cat = Category(name=name, tier=max_tier)
         db.add(new_cat)
         db.commit()
+        invalidate_home_view()
         db.refresh(new_cat)
         return (
             jsonify(
@@ -62,8 +63,6 @@ def add_category():
         db.rollback()
         print("DB error while adding category:", e)
         return jsonify({"error": "db error"}), 500
-    finally:
-        db.close()
 
 
 ALLOWED_EXT = {"png", "jpg", "jpeg", "webp", "gif"}
@@ -105,45 +104,22 @@ def upload_category_image():
     if size > MAX_FILE_SIZE:
         return jsonify({"error": "File too large"}), 400
 
-    filename = secure_filename(img.filename)
-    unique_name = f"{uuid4().hex}_{filename}"
-    upload_rel_dir = "uploads/categories"
-    upload_dir = os.path.join("static/", upload_rel_dir)
-    os.makedirs(upload_dir, exist_ok=True)
-    save_path = os.path.join(upload_dir, unique_name)
-    img.save(save_path)
+    db = db_session()
+    cat = db.query(Category).filter(Category.name == category_name).first()
+    if not cat:
+        return jsonify({"error": "Category not found"}), 404
 
-    image_path = f"{upload_rel_dir}/{unique_name}"
+    # ссылку на старый файл снимет services/uploads при commit
+    image_path = store_upload(db, img)
 
-    db = SessionLocal()
-    try:
-        cat = db.query(Category).filter(Category.name == category_name).first()
-        if not cat:
-            try:
-                os.remove(save_path)
-            except Exception:
-                pass
-            return jsonify({"error": "Category not found"}), 404
+    cat.image_path = image_path
+    db.add(cat)
+    db.commit()
+    invalidate_home_view()
+    db.refresh(cat)
 
-        # удалить старый файл, если он был
-        old = cat.image_path
-        if old:
-            try:
-                old_full = os.path.join("static/", old)
-                if os.path.exists(old_full):
-                    os.remove(old_full)
-            except Exception:
-                pass
-
-        cat.image_path = image_path
-        db.add(cat)
-        db.commit()
-        db.refresh(cat)
-
-        image_url = url_for("static", filename=image_path)
-        return jsonify({"image_path": image_path, "image_url": image_url})
-    finally:
-        db.close()
+    image_url = url_for("static", filename=image_path)
+    return jsonify({"image_path": image_path, "image_url": image_url})
 
 
 @categories_bp.route("/delete", methods=["POST"])
@@ -161,7 +137,7 @@ def delete_category():
         return jsonify({"error": "Missing 'name' in request"}), 400
 
     name = data["name"]
-    db = SessionLocal()
+    db = db_session()
     try:
         cat = db.query(Category).filter(Category.name == name).first()
         if not cat:
@@ -169,29 +145,22 @@ def delete_category():
 
         deleted_tier = cat.tier
 
-        # Удаляем файл изображения если есть
-        if cat.image_path:
-            try:
-                full = os.path.join("static/", cat.image_path)
-                if os.path.exists(full):
-                    os.remove(full)
-            except Exception:
-                pass
-
+        # товары, их картинки и файлы уходят каскадом (ссылки — при commit)
         db.delete(cat)
 
-        # Обновить tier всех категорий после удалённой
-        db.query(Category).filter(Category.tier > deleted_tier).update(
-            {Category.tier: Category.tier - 1}, synchronize_session=False
-        )
+        # Обновить tier всех категорий после удалённой (у созданных вместе
+        # с товаром tier не задан)
+        if deleted_tier is not None:
+            db.query(Category).filter(Category.tier > deleted_tier).update(
+                {Category.tier: Category.tier - 1}, synchronize_session=False
+            )
 
         db.commit()
+        invalidate_home_view()
         return jsonify({"success": True})
     except Exception as e:
         db.rollback()
         return jsonify({"error": str(e)}), 500
-    finally:
-        db.close()
 
 
 @categories_bp.route("/reorder", methods=["POST"])
@@ -212,7 +181,7 @@ def reorder_categories():
     if not isinstance(order, list):
         return jsonify({"error": "'order' must be an array"}), 400
 
-    db = SessionLocal()
+    db = db_session()
     try:
         # Обновить tier для каждой категории
         for idx, category_name in enumerate(order):
@@ -222,10 +191,9 @@ def reorder_categories():
                 db.add(cat)
 
         db.commit()
+        invalidate_home_view()
         return jsonify({"success": True, "updated": len(order)})
     except Exception as e:
         db.rollback()
         print(f"Error reordering categories: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        db.close()
@@ -1,7 +1,4 @@
-import os
-from werkzeug.utils import secure_filename
-
-from initdb import SessionLocal
+from initdb import db_session
 from models.models import (
     Category,
     Product,
@@ -10,17 +7,19 @@ from models.models import (
     AddOnItem,
 )
 from sqlalchemy.orm import joinedload
+from database.home_cache import invalidate_home_view
+from services.uploads import store_upload
 
 from flask import Blueprint, flash, render_template, request, redirect, session, url_for
 
-from config import UPLOAD_FOLDER, ALLOWED_EXT, BASE_DIR
+from config import ALLOWED_EXT
 
 products_bp = Blueprint("products", __name__, template_folder="../templates")
 
 
 @products_bp.route("/update_product/<int:product_id>", methods=["GET", "POST"])
 def update_product(product_id):
-    db = SessionLocal()
+    db = db_session()
     try:
         product = (
             db.query(Product)
@@ -60,31 +59,16 @@ def update_product(product_id):
         product.category_id = int(category_id) if category_id else None
 
         preview_file = request.files.get("product-preview")
+        # ссылки на старые файлы снимает services/uploads при commit
         if delete_preview and product.preview:
-            try:
-                full_path = os.path.join(BASE_DIR, product.preview)
-                if os.path.exists(full_path):
-                    os.remove(full_path)
-            except Exception as e:
-                print("Cannot delete preview:", e)
             product.preview = None
         if preview_file and preview_file.filename != "":
-            filename = secure_filename(preview_file.filename)
-            save_name = f"preview_{filename}"
-            save_path = os.path.join(UPLOAD_FOLDER, save_name)
-            preview_file.save(save_path)
-            product.preview = os.path.relpath(save_path, BASE_DIR)
+            product.preview = store_upload(db, preview_file, static_prefix=True)
 
         keep_images = request.form.getlist("existing_images")
         keep_images = [p for p in keep_images if p]
         for img in list(product.images):
             if img.path not in keep_images:
-                try:
-                    full_path = os.path.join(BASE_DIR, img.path)
-                    if os.path.exists(full_path):
-                        os.remove(full_path)
-                except Exception as e:
-                    print("Cannot delete product image file:", e)
                 try:
                     db.delete(img)
                 except Exception as e:
@@ -93,13 +77,8 @@ def update_product(product_id):
         new_images = request.files.getlist("product-images")
         for f in new_images:
             if f and f.filename != "":
-                filename = secure_filename(f.filename)
-                save_name = f"img_{filename}"
-                save_path = os.path.join(UPLOAD_FOLDER, save_name)
-                f.save(save_path)
-                img = ProductImage(
-                    product_id=product.id, path=os.path.relpath(save_path, BASE_DIR)
-                )
+                path = store_upload(db, f, static_prefix=True)
+                img = ProductImage(product_id=product.id, path=path)
                 db.add(img)
 
         attributes_field = request.form.get("attributes")
@@ -118,17 +97,6 @@ def update_product(product_id):
         ]
         for addon in list(product.addon_categories):
             if addon.id not in existing_addon_ids:
-                for item in list(addon.items):
-                    try:
-                        full_path = os.path.join(BASE_DIR, item.image_path)
-                        if os.path.exists(full_path):
-                            os.remove(full_path)
-                    except Exception as e:
-                        print("Cannot delete addon item file:", e)
-                    try:
-                        db.delete(item)
-                    except Exception as e:
-                        print("Cannot delete AddOnItem record:", e)
                 try:
                     db.delete(addon)
                 except Exception as e:
@@ -162,13 +130,6 @@ def update_product(product_id):
             for item in list(addon.items):
                 if item.id not in keep_items_ids:
                     # Удаляем элемент
-                    if item.image_path:
-                        try:
-                            full_path = os.path.join(BASE_DIR, item.image_path)
-                            if os.path.exists(full_path):
-                                os.remove(full_path)
-                        except Exception as e:
-                            print("Cannot delete addon item file:", e)
                     try:
                         db.delete(item)
                     except Exception as e:
@@ -189,10 +150,7 @@ def update_product(product_id):
                 names = request.form.getlist(names_key)
                 for idx, f in enumerate(files):
                     if f and f.filename != "":
-                        filename = secure_filename(f.filename)
-                        save_name = f"addon_{addon_id}_{filename}"
-                        save_path = os.path.join(UPLOAD_FOLDER, save_name)
-                        f.save(save_path)
+                        image_path = store_upload(db, f, static_prefix=True)
 
                         item_name = names[idx].strip() if idx < len(names) else ""
                         if not item_name:
@@ -201,7 +159,7 @@ def update_product(product_id):
                         item = AddOnItem(
                             addon_category_id=addon.id,
                             name=item_name,
-                            image_path=os.path.relpath(save_path, BASE_DIR),
+                            image_path=image_path,
                         )
                         db.add(item)
 
@@ -232,10 +190,7 @@ def update_product(product_id):
                 names = request.form.getlist(names_key_new)
                 for file_idx, f in enumerate(files):
                     if f and f.filename != "":
-                        filename = secure_filename(f.filename)
-                        save_name = f"addon_new_{new_addon.id}_{filename}"
-                        save_path = os.path.join(UPLOAD_FOLDER, save_name)
-                        f.save(save_path)
+                        image_path = store_upload(db, f, static_prefix=True)
 
                         item_name = (
                             names[file_idx].strip() if file_idx < len(names) else ""
@@ -246,11 +201,12 @@ def update_product(product_id):
                         item = AddOnItem(
                             addon_category_id=new_addon.id,
                             name=item_name,
-                            image_path=os.path.relpath(save_path, BASE_DIR),
+                            image_path=image_path,
                         )
                         db.add(item)
 
         db.commit()
+        invalidate_home_view()
         flash("Товар обновлен", "success")
         return redirect(url_for("admin.admin_products"))
 
@@ -259,65 +215,34 @@ def update_product(product_id):
         print("Update product error:", e)
         flash("Ошибка при обновлении товара", "error")
         return redirect(url_for("admin.admin_products"))
-    finally:
-        db.close()
-
-
-def _is_within_directory(path, directory):
-    path = os.path.realpath(path)
-    directory = os.path.realpath(directory)
-    return os.path.commonpath([path]) == os.path.commonpath([path, directory])
 
 
 @products_bp.route("/delete_product/<int:product_id>", methods=["GET", "POST"])
 def delete_product(product_id):
     if not session.get("admin_logged_in"):
         return redirect(url_for("admin_login"))
-    db = SessionLocal()
-    try:
-        product = db.query(Product).options(joinedload(Product.images)).get(product_id)
-        if request.method == "GET":
-            if not product:
-                flash("Товар не найден", "error")
-                return redirect(url_for("admin.admin_products"))
-            return render_template("delete_product.html", product=product)
-        # POST -> удалить
+    db = db_session()
+    product = db.query(Product).options(joinedload(Product.images)).get(product_id)
+    if request.method == "GET":
         if not product:
             flash("Товар не найден", "error")
             return redirect(url_for("admin.admin_products"))
-        if product.preview:
-            try:
-                full_preview = os.path.join(BASE_DIR, product.preview)
-                if os.path.exists(full_preview) and _is_within_directory(
-                    full_preview, BASE_DIR
-                ):
-                    os.remove(full_preview)
-            except Exception as e:
-                print("Error deleting preview file:", e)
-        for img in list(product.images):
-            try:
-                full_img = os.path.join(BASE_DIR, img.path)
-                if os.path.exists(full_img) and _is_within_directory(
-                    full_img, BASE_DIR
-                ):
-                    os.remove(full_img)
-            except Exception as e:
-                print("Error deleting product image file:", e)
-            try:
-                db.delete(img)
-            except Exception as e:
-                print("Error deleting ProductImage record:", e)
-        try:
-            db.delete(product)
-            db.commit()
-            flash("Товар удалён", "success")
-        except Exception as e:
-            db.rollback()
-            print("DB error while deleting product:", e)
-            flash("Ошибка при удалении товара. Смотрите логи.", "error")
+        return render_template("delete_product.html", product=product)
+    # POST -> удалить
+    if not product:
+        flash("Товар не найден", "error")
         return redirect(url_for("admin.admin_products"))
-    finally:
-        db.close()
+    # картинки и допы удаляются каскадом, ссылки на файлы снимаются при commit
+    try:
+        db.delete(product)
+        db.commit()
+        invalidate_home_view()
+        flash("Товар удалён", "success")
+    except Exception as e:
+        db.rollback()
+        print("DB error while deleting product:", e)
+        flash("Ошибка при удалении товара. Смотрите логи.", "error")
+    return redirect(url_for("admin.admin_products"))
 
 
 def allowed_file(filename):
@@ -350,36 +275,35 @@ def add_product():
     attributes_str = ";".join(attributes) if attributes else None
     print("Received attributes:", attributes)
 
-    # ------------------ Сохранение файлов на диск ------------------
+    # ------------------ Проверка файлов ------------------
     preview = request.files.get("product-preview")
-    preview_saved_path = None
+    preview_upload = None
     if preview and preview.filename != "" and allowed_file(preview.filename):
-        filename = secure_filename(preview.filename)
-        # можно добавить уникальный префикс, чтобы предотвратить коллизии
-        save_name = f"preview_{filename}"
-        save_path = os.path.join(UPLOAD_FOLDER, save_name)
-        preview.save(save_path)
-        preview_saved_path = os.path.relpath(
-            save_path, BASE_DIR
-        )  # например "static/uploads/preview_x.jpg"
+        preview_upload = preview
     elif preview and preview.filename != "":
         print("Preview file has disallowed extension:", preview.filename)
 
     images = request.files.getlist("product-images")
-    saved_image_paths = []
+    image_uploads = []
     for f in images:
         if f and f.filename != "" and allowed_file(f.filename):
-            filename = secure_filename(f.filename)
-            save_name = f"img_{filename}"
-            save_path = os.path.join(UPLOAD_FOLDER, save_name)
-            f.save(save_path)
-            saved_image_paths.append(os.path.relpath(save_path, BASE_DIR))
+            image_uploads.append(f)
         elif f and f.filename != "":
             print("Skipped file (disallowed ext):", f.filename)
 
     # ------------------ Сохранение в БД ------------------
-    db = SessionLocal()
+    db = db_session()
     try:
+        # файлы кладутся в хранилище uploads/cas, переносит их фоновая задача
+        preview_saved_path = None
+        if preview_upload:
+            preview_saved_path = store_upload(
+                db, preview_upload, static_prefix=True
+            )  # например "static/uploads/cas/ab/ab12...ef.jpg"
+        saved_image_paths = [
+            store_upload(db, f, static_prefix=True) for f in image_uploads
+        ]
+
         # Найдём или создадим категорию
         category = None
         if category_name:
@@ -387,8 +311,6 @@ def add_product():
             if not category:
                 category = Category(name=category_name)
                 db.add(category)
-                db.commit()
-                db.refresh(category)
 
         # Создаём продукт
         product = Product(
@@ -401,15 +323,16 @@ def add_product():
             attributes=attributes_str,
         )
         db.add(product)
-        db.commit()
-        db.refresh(product)  # теперь у product есть id
+        db.flush()  # теперь у product есть id
 
-        # Добавляем ProductImage записи
+        # Добавляем ProductImage записи; всё одной транзакцией: загрузки
+        # засчитываются ссылками только вместе с записями, которые на них ссылаются
         for idx, pth in enumerate(saved_image_paths):
             img = ProductImage(product_id=product.id, path=pth, sort_order=idx)
             db.add(img)
         db.commit()
         db.refresh(product)
+        invalidate_home_view()
 
         # (опционально) можно хранить attributes где-то — пока просто логируем
         print("=== New product saved to DB ===")
@@ -430,5 +353,3 @@ def add_product():
         print("DB error while saving product:", e)
         flash("Ошибка при сохранении продукта. Смотрите логи.", "error")
         return redirect(url_for("admin.admin_panel"))
-    finally:
-        db.close()
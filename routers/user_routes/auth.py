@@ -1,26 +1,16 @@
-import re
-from models.models import User
-from initdb import SessionLocal
+from initdb import db_session
+from database.cart import merge_items, upsert_cart
+from database.guest_cart import pop_guest_cart
+from database.login_keys import find_user
+from services.passwords import HasherBusy, hash_password, needs_rehash, verify_password
+from services.session_store import login_user, logout_user
+from middlewares.login import rate_limited
 from urllib.parse import urlparse, urljoin
-from werkzeug.security import check_password_hash
 from flask import Blueprint, render_template, request, redirect, url_for, session
 
 auth = Blueprint("auth", __name__)
 
 
-def normalize_phone(phone: str) -> str:
-    if not phone:
-        return ""
-    phone = re.sub(r"[^\d+]", "", phone.strip())
-    if phone.startswith("0") and len(phone) >= 10:
-        phone = "+38" + phone
-    if re.fullmatch(r"\d{10}", phone):
-        phone = "+38" + phone
-    if phone and not phone.startswith("+"):
-        phone = "+" + phone
-    return phone
-
-
 def is_safe_url(target):
     ref_url = urlparse(request.host_url)
     test_url = urlparse(urljoin(request.host_url, target))
@@ -28,6 +18,7 @@ def is_safe_url(target):
 
 
 @auth.route("/login", methods=["GET", "POST"])
+@rate_limited("login.html", identifier_field="identifier")
 def login():
     if "user_id" in session:
         return redirect(url_for("profile"))
@@ -36,38 +27,44 @@ def login():
     if request.method == "POST":
         identifier = (request.form.get("identifier") or "").strip()
         password = request.form.get("password", "")
-        norm_phone = normalize_phone(identifier)
 
-        db = SessionLocal()
-        try:
-            user = None
-            if "@" in identifier:
-                user = db.query(User).filter(User.email == identifier).first()
-            else:
-                user = db.query(User).filter(User.phone == norm_phone).first()
-                if not user:
-                    user = db.query(User).filter(User.phone == identifier).first()
-            if not user:
-                user = db.query(User).filter(User.username == identifier).first()
+        db = db_session()
+        # email, телефон или имя — один запрос к login_keys
+        user = find_user(db, identifier)
 
-            if not user:
-                error = "Користувача не знайдено. Перевірте email або телефон."
-                return render_template("login.html", error=error)
+        if not user:
+            error = "Користувача не знайдено. Перевірте email або телефон."
+            return render_template("login.html", error=error)
 
-            if not check_password_hash(user.hashed_password, password):
+        try:
+            if not verify_password(user.hashed_password, password):
                 error = "Неправильний логін або пароль."
                 return render_template("login.html", error=error)
+            # пароль верный — хэш со старыми параметрами заменяем на текущий
+            if needs_rehash(user.hashed_password):
+                user.hashed_password = hash_password(password)
+        except HasherBusy:
+            error = "Сервер перевантажений, спробуйте пізніше."
+            return render_template("login.html", error=error), 503
 
-            session["user_id"] = user.id
-            remember = request.form.get("remember")
-            session.permanent = bool(remember)
+        # гостевая корзина из сессии переносится в БД одним запросом
+        guest_cart = pop_guest_cart()
+        login_user(user, permanent=bool(request.form.get("remember")))
+        if guest_cart:
+            merge_items(db, upsert_cart(db, user.id), guest_cart)
+        if guest_cart or db.dirty:
+            db.commit()
 
-            next_url = request.args.get("next")
-            if next_url and is_safe_url(next_url):
-                return redirect(next_url)
-            return redirect(url_for("profile"))
-
-        finally:
-            db.close()
+        next_url = request.args.get("next")
+        if next_url and is_safe_url(next_url):
+            return redirect(next_url)
+        return redirect(url_for("profile"))
 
     return render_template("login.html", error=error)
+
+
+@auth.route("/logout", methods=["POST"])
+def logout():
+    # "everywhere" — завершить и сессии на других устройствах
+    logout_user(everywhere=bool(request.form.get("everywhere")))
+    return redirect(url_for("auth.login"))
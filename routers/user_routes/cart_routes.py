@@ -1,129 +1,145 @@
 from flask import Blueprint, request, jsonify, session
-from sqlalchemy.orm import joinedload
-from models.models import Cart, CartItem, Product, User
-from initdb import SessionLocal
-from middlewares.login import login_required, api_login_required
+from initdb import db_session, read_session
+from database.cart import (
+    add_item,
+    cart_count,
+    cart_summary,
+    price_cart,
+    price_guest_cart,
+    remove_item,
+    set_item_quantity,
+    upsert_cart,
+)
+from database.guest_cart import MAX_LINES, MAX_QUANTITY, get_guest_cart, save_guest_cart
+from database.loaders import get_loaders
 
 cart_bp = Blueprint("cart", __name__, url_prefix="/api/cart")
 
 
+def _positive_int(value):
+    """
+    Целое > 0 из JSON: число или строка вида "12". None — если не подходит.
+    Гостевая корзина и БД должны получать один и тот же id.
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        number = int(value.strip() if isinstance(value, str) else value)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(value, float) and number != value:
+        return None
+    return number if number > 0 else None
+
+
 @cart_bp.route("/add", methods=["POST"])
-@api_login_required
 def add_to_cart():
     """Добавить товар в корзину"""
-    db = SessionLocal()
+    db = db_session()
     try:
-        data = request.get_json()
-        product_id = data.get("product_id")
-        quantity = data.get("quantity", 1)
+        data = request.get_json(silent=True) or {}
+        product_id = _positive_int(data.get("product_id"))
+        quantity = _positive_int(data.get("quantity", 1))
 
-        if not product_id:
+        if product_id is None:
             return jsonify({"success": False, "message": "ID товару не вказано"}), 400
 
-        # проверяем существование товара
-        product = db.query(Product).get(product_id)
-        if not product:
-            return jsonify({"success": False, "message": "Товар не знайдено"}), 404
-
-        user_id = session["user_id"]
-
-        # получаем или создаём корзину пользователя
-        cart = db.query(Cart).filter(Cart.user_id == user_id).first()
-        if not cart:
-            cart = Cart(user_id=user_id)
-            db.add(cart)
-            db.flush()  # чтобы получить cart.id
-
-        # проверяем, есть ли уже этот товар в корзине
-        cart_item = (
-            db.query(CartItem)
-            .filter(CartItem.cart_id == cart.id, CartItem.product_id == product_id)
-            .first()
-        )
+        if quantity is None:
+            return (
+                jsonify(
+                    {"success": False, "message": "Кількість повинна бути більше 0"}
+                ),
+                400,
+            )
 
-        if cart_item:
-            # если товар уже есть — увеличиваем количество
-            cart_item.quantity += quantity
-        else:
-            # создаём новую позицию
-            cart_item = CartItem(
-                cart_id=cart.id, product_id=product_id, quantity=quantity
+        user_id = session.get("user_id")
+        if user_id is None:
+            quantities = get_guest_cart()
+            if product_id not in quantities and len(quantities) >= MAX_LINES:
+                return jsonify({"success": False, "message": "Кошик переповнений"}), 400
+            quantities[product_id] = min(
+                quantities.get(product_id, 0) + quantity, MAX_QUANTITY
             )
-            db.add(cart_item)
+            return _guest_response(quantities, product_id, "Товар додано до кошику")
+
+        # корзина и позиция создаются/увеличиваются атомарно (ON CONFLICT),
+        # без чтения перед записью — параллельные клики не теряют количество
+        cart_id = upsert_cart(db, user_id)
+        added = add_item(db, cart_id, product_id, quantity)
+        if added is None:
+            db.rollback()
+            return jsonify({"success": False, "message": "Товар не знайдено"}), 404
 
+        # в ответе только изменённая позиция и итоги, без всей корзины
+        cart_data = cart_summary(db, user_id, item_id=added.id)
         db.commit()
 
-        # возвращаем обновлённую информацию о корзине
-        cart_data = get_cart_data(db, user_id)
-
         return jsonify(
-            {"success": True, "message": "Товар додано до кошику", "cart": cart_data}
+            {
+                "success": True,
+                "message": "Товар додано до кошику",
+                "item": cart_data.pop("item"),
+                "cart": cart_data,
+            }
         )
 
     except Exception as e:
         db.rollback()
         return jsonify({"success": False, "message": str(e)}), 500
-    finally:
-        db.close()
 
 
 @cart_bp.route("/remove", methods=["POST"])
-@api_login_required
 def remove_from_cart():
     """Удалить товар из корзины"""
-    db = SessionLocal()
+    db = db_session()
     try:
-        data = request.get_json()
-        cart_item_id = data.get("cart_item_id")
+        data = request.get_json(silent=True) or {}
+        cart_item_id = _positive_int(data.get("cart_item_id"))
 
-        if not cart_item_id:
+        if cart_item_id is None:
             return jsonify({"success": False, "message": "ID позиції не вказано"}), 400
 
-        user_id = session["user_id"]
-        cart = db.query(Cart).filter(Cart.user_id == user_id).first()
-
-        if not cart:
-            return jsonify({"success": False, "message": "Кошик не знайдено"}), 404
+        user_id = session.get("user_id")
+        if user_id is None:
+            quantities = get_guest_cart()
+            if quantities.pop(cart_item_id, None) is None:
+                return jsonify({"success": False, "message": "Позиція не знайдена"}), 404
+            return _guest_response(quantities, None, "Товар видалено з кошику")
 
-        cart_item = (
-            db.query(CartItem)
-            .filter(CartItem.id == cart_item_id, CartItem.cart_id == cart.id)
-            .first()
-        )
-
-        if not cart_item:
+        if not remove_item(db, user_id, cart_item_id):
             return jsonify({"success": False, "message": "Позиція не знайдена"}), 404
 
-        db.delete(cart_item)
+        cart_data = cart_summary(db, user_id)
         db.commit()
 
-        cart_data = get_cart_data(db, user_id)
-
         return jsonify(
-            {"success": True, "message": "Товар видалено з кошику", "cart": cart_data}
+            {
+                "success": True,
+                "message": "Товар видалено з кошику",
+                "item": {"id": cart_item_id, "quantity": 0, "subtotal": 0},
+                "cart": cart_data,
+            }
         )
 
     except Exception as e:
         db.rollback()
         return jsonify({"success": False, "message": str(e)}), 500
-    finally:
-        db.close()
 
 
 @cart_bp.route("/update", methods=["POST"])
-@api_login_required
 def update_cart_item():
     """Обновить количество товара в корзине"""
-    db = SessionLocal()
+    db = db_session()
     try:
-        data = request.get_json()
-        cart_item_id = data.get("cart_item_id")
+        data = request.get_json(silent=True) or {}
+        cart_item_id = _positive_int(data.get("cart_item_id"))
         quantity = data.get("quantity")
 
-        if not cart_item_id or quantity is None:
+        if cart_item_id is None or quantity is None:
             return jsonify({"success": False, "message": "Невірні дані"}), 400
 
-        if quantity <= 0:
+        quantity = _positive_int(quantity)
+        if quantity is None:
             return (
                 jsonify(
                     {"success": False, "message": "Кількість повинна бути більше 0"}
@@ -131,70 +147,132 @@ def update_cart_item():
                 400,
             )
 
-        user_id = session["user_id"]
-        cart = db.query(Cart).filter(Cart.user_id == user_id).first()
+        user_id = session.get("user_id")
+        if user_id is None:
+            quantities = get_guest_cart()
+            if cart_item_id not in quantities:
+                return jsonify({"success": False, "message": "Позиція не знайдена"}), 404
+            quantities[cart_item_id] = min(quantity, MAX_QUANTITY)
+            return _guest_response(quantities, cart_item_id, "Кількість оновлено")
 
-        if not cart:
-            return jsonify({"success": False, "message": "Кошик не знайдено"}), 404
-
-        cart_item = (
-            db.query(CartItem)
-            .filter(CartItem.id == cart_item_id, CartItem.cart_id == cart.id)
-            .first()
-        )
-
-        if not cart_item:
+        if not set_item_quantity(db, user_id, cart_item_id, quantity):
             return jsonify({"success": False, "message": "Позиція не знайдена"}), 404
 
-        cart_item.quantity = quantity
+        cart_data = cart_summary(db, user_id, item_id=cart_item_id)
         db.commit()
 
-        cart_data = get_cart_data(db, user_id)
-
         return jsonify(
-            {"success": True, "message": "Кількість оновлено", "cart": cart_data}
+            {
+                "success": True,
+                "message": "Кількість оновлено",
+                "item": cart_data.pop("item"),
+                "cart": cart_data,
+            }
         )
 
     except Exception as e:
         db.rollback()
         return jsonify({"success": False, "message": str(e)}), 500
-    finally:
-        db.close()
 
 
 @cart_bp.route("/get", methods=["GET"])
-@api_login_required
 def get_cart():
     """Получить содержимое корзины"""
-    db = SessionLocal()
+    db = db_session()
     try:
-        user_id = session["user_id"]
-        cart_data = get_cart_data(db, user_id)
+        cart_data = get_cart_data(db, session.get("user_id"))
 
         return jsonify({"success": True, "cart": cart_data})
 
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
-    finally:
-        db.close()
 
 
-def get_cart_data(db, user_id):
-    """Вспомогательная функция для получения данных корзины"""
-    cart = (
-        db.query(Cart)
-        .options(joinedload(Cart.items).joinedload(CartItem.product))
-        .filter(Cart.user_id == user_id)
-        .first()
+@cart_bp.route("/summary", methods=["GET"])
+def get_cart_summary():
+    """Количество товаров и сумма корзины (для значка в шапке)"""
+    db = db_session()
+    try:
+        user_id = session.get("user_id")
+        if user_id is None:
+            priced = price_guest_cart(read_session(), get_guest_cart())
+            cart_data = _totals(priced)
+        else:
+            cart_data = cart_summary(db, user_id)
+        return jsonify({"success": True, "cart": cart_data})
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@cart_bp.route("/count", methods=["GET"])
+def get_cart_count():
+    """
+    Только количество товаров для значка. У гостя — из cookie корзины, без БД;
+    у пользователя — из БД: корзину могли изменить в другой сессии.
+    """
+    user_id = session.get("user_id")
+    if user_id is None:
+        count = sum(get_guest_cart().values())
+    else:
+        count = cart_count(db_session(), user_id)
+    return jsonify({"success": True, "total_items": count})
+
+
+def _totals(priced):
+    return {"total_items": priced.total_items, "total_price": priced.total_price}
+
+
+def _guest_response(quantities, item_id, message):
+    """
+    Гостевая корзина: цены берутся из каталога (реплика), сама корзина
+    сохраняется только в подписанной cookie (database/guest_cart.py).
+    Пропавшие из каталога товары выпадают.
+    """
+    priced = price_guest_cart(read_session(), quantities)
+    line = next((ln for ln in priced.lines if ln.id == item_id), None)
+    if item_id is not None and line is None:
+        return jsonify({"success": False, "message": "Товар не знайдено"}), 404
+
+    save_guest_cart({ln.product_id: ln.quantity for ln in priced.lines})
+    item = {"id": item_id, "quantity": 0, "subtotal": 0}
+    if line is not None:
+        item = {
+            "id": line.id,
+            "product_id": line.product_id,
+            "quantity": line.quantity,
+            "subtotal": line.subtotal,
+        }
+    return jsonify(
+        {"success": True, "message": message, "item": item, "cart": _totals(priced)}
     )
 
-    if not cart:
-        return {"items": [], "total_items": 0, "total_price": 0}
 
-    items = [item.as_dict() for item in cart.items]
+def get_cart_data(db, user_id):
+    """
+    Вспомогательная функция для получения данных корзины.
+    user_id=None — гостевая корзина из подписанной cookie.
+    """
+    if user_id is None:
+        db = read_session()
+        priced = price_guest_cart(db, get_guest_cart())
+    else:
+        priced = price_cart(db, user_id)
+
+    # товары со всеми связями одной пачкой: число запросов не зависит от позиций
+    products = get_loaders(db).products.load_many(
+        [line.product_id for line in priced.lines]
+    )
 
-    return {
-        "items": items,
-        "total_items": cart.total_items(),
-        "total_price": cart.total_price(),
-    }
+    items = [
+        {
+            "id": line.id,
+            "product": product.as_dict(),
+            "quantity": line.quantity,
+            "subtotal": line.subtotal,
+            "added_at": line.added_at.isoformat() if line.added_at else None,
+        }
+        for line, product in zip(priced.lines, products)
+    ]
+
+    return {"items": items, **_totals(priced)}
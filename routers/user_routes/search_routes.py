@@ -0,0 +1,85 @@
+from flask import Blueprint, jsonify, render_template, request, url_for
+
+from initdb import read_session
+from database.search import SEARCH_PAGE_SIZE, search_products
+from middlewares.page_cache import cached_page
+from services.suggest import suggest
+
+search_bp = Blueprint("search", __name__)
+
+
+def _page_arg():
+    try:
+        return max(1, int(request.args.get("page", 1)))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _image_url(p):
+    path = p.preview or p.first_image
+    if not path:
+        return None
+    if path.startswith(("http://", "https://")):
+        return path
+    return url_for("static", filename=path[7:] if path.startswith("static/") else path)
+
+
+@search_bp.route("/search")
+@cached_page
+def search_page():
+    q = (request.args.get("q") or "").strip()
+    page = _page_arg()
+    products, total = search_products(read_session(), q, page)
+    return render_template(
+        "search.html",
+        q=q,
+        page=page,
+        products=products,
+        total=total,
+        has_next=page * SEARCH_PAGE_SIZE < total,
+    )
+
+
+@search_bp.route("/api/search")
+@cached_page
+def search_api():
+    """Поиск товаров: ?q=<текст>&page=<n>, результаты по релевантности"""
+    q = (request.args.get("q") or "").strip()
+    page = _page_arg()
+    products, total = search_products(read_session(), q, page)
+    return jsonify(
+        {
+            "success": True,
+            "q": q,
+            "page": page,
+            "total": total,
+            "has_next": page * SEARCH_PAGE_SIZE < total,
+            "results": [
+                {
+                    "id": p.id,
+                    "name": p.name,
+                    "category": p.category_name,
+                    "price": p.price,
+                    "discount_percent": p.discount_percent,
+                    "sale_price": p.sale_price,
+                    "image_url": _image_url(p),
+                    "url": url_for("product_info", product_id=p.id),
+                }
+                for p in products
+            ],
+        }
+    )
+
+
+@search_bp.route("/api/suggest")
+def suggest_api():
+    """Подсказки по мере ввода: ?q=<начало названия товара или категории>"""
+    q = (request.args.get("q") or "").strip()[:100]
+    suggestions = []
+    for kind, id_, name in suggest(q):
+        if kind == "category":
+            url = url_for("shop", category=name.lower())
+        else:
+            url = url_for("product_info", product_id=id_)
+        suggestions.append({"type": kind, "id": id_, "name": name, "url": url})
+    return jsonify({"success": True, "q": q, "suggestions": suggestions})
@@ -1,9 +1,11 @@
 import re
 
 from models.models import User
-from initdb import SessionLocal
+from initdb import db_session
+from database.login_keys import add_login_keys, taken_kinds
+from services.passwords import HasherBusy, hash_password
+from middlewares.login import rate_limited
 from sqlalchemy.exc import IntegrityError
-from werkzeug.security import generate_password_hash
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 
 reg_bp = Blueprint("reg", __name__, template_folder="../templates")
@@ -41,6 +43,7 @@ def register():
 
 
 @reg_bp.route("/register-data", methods=["POST"])
+@rate_limited("register.html", identifier_field="phone")
 def register_data():
     """Обработка данных регистрации"""
 
@@ -81,34 +84,24 @@ def register_data():
         print("Registration validation failed:", errors, flush=True)
         return render_template("register.html", error="; ".join(errors))
 
-    session = SessionLocal()
+    session = db_session()
 
     try:
-        existing_user = (
-            session.query(User)
-            .filter((User.phone == phone) | (User.username == full_name))
-            .first()
-        )
-
-        if existing_user:
-            if existing_user.phone == phone:
+        # занятость email/телефона/имени — одним запросом к login_keys,
+        # телефоны сравниваются в нормализованном виде
+        taken = taken_kinds(session, email, phone, full_name)
+        if taken:
+            if "phone" in taken:
                 error_msg = "Користувач з таким номером телефону вже існує"
-            else:
+            elif "username" in taken:
                 error_msg = "Користувач з таким ім'ям вже існує"
+            else:
+                error_msg = "Користувач з такою електронною адресою вже існує"
 
             print(f"Registration failed: {error_msg}", flush=True)
             return render_template("register.html", error=error_msg)
 
-        if email:
-            existing_email = session.query(User).filter(User.email == email).first()
-            if existing_email:
-                print("Registration failed: email already exists", flush=True)
-                return render_template(
-                    "register.html",
-                    error="Користувач з такою електронною адресою вже існує",
-                )
-
-        hashed_password = generate_password_hash(password, method="pbkdf2:sha256")
+        hashed_password = hash_password(password)
 
         new_user = User(
             username=full_name,
@@ -117,6 +110,7 @@ def register_data():
             hashed_password=hashed_password,
         )
 
+        add_login_keys(new_user)
         session.add(new_user)
         session.commit()
 
@@ -126,6 +120,16 @@ def register_data():
 
         return redirect(url_for("auth.login"))
 
+    except HasherBusy:
+        session.rollback()
+        print("Registration failed: password hasher is busy", flush=True)
+        return (
+            render_template(
+                "register.html", error="Сервер перевантажений, спробуйте пізніше."
+            ),
+            503,
+        )
+
     except IntegrityError as e:
         session.rollback()
         print(f"Database integrity error: {e}", flush=True)
@@ -140,5 +144,3 @@ def register_data():
             "register.html", error="Виникла помилка при реєстрації. Спробуйте пізніше."
         )
 
-    finally:
-        session.close()
@@ -0,0 +1,163 @@
+import hashlib
+import mimetypes
+import os
+import sys
+
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+from config import BUILD_ID
+from middlewares.compression import available_encodings, compress, is_compressible
+
+# загрузки в манифест не попадают: они меняются на лету,
+# а файлы из uploads/cas неизменяемы сами по себе
+EXCLUDED_DIRS = ("uploads",)
+IMMUTABLE_PREFIXES = ("uploads/cas/",)
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+ONE_YEAR = 365 * 24 * 60 * 60
+
+# путь относительно static/ -> короткий хэш содержимого
+_manifest = {}
+# отпечаток выкладки (статика + шаблоны + BUILD_ID) и время самого нового
+# файла: входят в ETag/Last-Modified страниц, чтобы после деплоя клиент не
+# получил 304 на старый HTML со ссылками на старые ?v=
+_deploy = {"token": "", "modified_at": 0.0}
+
+
+def build_manifest(static_dir):
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        rel_root = os.path.relpath(root, static_dir).replace(os.sep, "/")
+        if rel_root == ".":
+            rel_root = ""
+            dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+        for name in files:
+            if name.startswith(".") or name.endswith((".br", ".gz")):
+                continue
+            rel = f"{rel_root}/{name}" if rel_root else name
+            digest = hashlib.sha256()
+            with open(os.path.join(root, name), "rb") as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b""):
+                    digest.update(chunk)
+            manifest[rel] = digest.hexdigest()[:12]
+    return manifest
+
+
+def build_deploy_token(manifest, static_dir, template_dir):
+    """(отпечаток выкладки, mtime самого нового файла статики или шаблонов)."""
+    digest = hashlib.sha256(BUILD_ID.encode("utf-8"))
+    for rel, file_hash in sorted(manifest.items()):
+        digest.update(f"{rel}:{file_hash}\n".encode("utf-8"))
+    paths = []
+    for root, _, files in os.walk(template_dir):
+        paths.extend(os.path.join(root, name) for name in files)
+    for full in sorted(paths):
+        digest.update(os.path.relpath(full, template_dir).encode("utf-8"))
+        with open(full, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    paths += [os.path.join(static_dir, rel) for rel in manifest]
+    modified_at = max((os.path.getmtime(p) for p in paths), default=0.0)
+    return digest.hexdigest()[:16], modified_at
+
+
+def deploy_token():
+    """(отпечаток текущей выкладки, время её последнего изменения)."""
+    return _deploy["token"], _deploy["modified_at"]
+
+
+def precompress_static(static_dir):
+    """
+    Кладёт рядом со статикой .br/.gz копии (максимальное сжатие, один раз
+    при сборке). Копия пишется, только если она меньше оригинала.
+    """
+    suffixes = dict(PRECOMPRESSED)
+    written = 0
+    for rel in build_manifest(static_dir):
+        mimetype = mimetypes.guess_type(rel)[0]
+        if not is_compressible(mimetype):
+            continue
+        full = os.path.join(static_dir, rel)
+        with open(full, "rb") as f:
+            data = f.read()
+        for encoding in available_encodings():
+            quality = 11 if encoding == "br" else 9
+            packed = compress(data, encoding, quality=quality)
+            if len(packed) < len(data):
+                with open(full + suffixes[encoding], "wb") as out:
+                    out.write(packed)
+                written += 1
+    return written
+
+
+def _is_fingerprinted(filename):
+    if filename.startswith(IMMUTABLE_PREFIXES):
+        return True
+    digest = _manifest.get(filename)
+    return digest is not None and request.args.get("v") == digest
+
+
+def _pick_encoding(full_path):
+    accepted = request.accept_encodings
+    for encoding, suffix in PRECOMPRESSED:
+        if accepted[encoding] and os.path.isfile(full_path + suffix):
+            return encoding, full_path + suffix
+    return None, full_path
+
+
+def init_assets(app):
+    """
+    Строит манифест статики, добавляет ?v=<hash> ко всем url_for('static', ...)
+    и отдаёт такие файлы с Cache-Control: immutable на год
+    (и готовыми .br/.gz копиями, если они лежат рядом).
+    """
+    _manifest.clear()
+    _manifest.update(build_manifest(app.static_folder))
+    token, modified_at = build_deploy_token(
+        _manifest, app.static_folder, os.path.join(app.root_path, app.template_folder)
+    )
+    _deploy.update(token=token, modified_at=modified_at)
+
+    @app.url_defaults
+    def add_fingerprint(endpoint, values):
+        if endpoint == "static" and "v" not in values:
+            digest = _manifest.get(values.get("filename"))
+            if digest:
+                values["v"] = digest
+
+    def serve_static(filename):
+        full_path = safe_join(app.static_folder, filename)
+        if full_path is None or not os.path.isfile(full_path):
+            abort(404)
+
+        encoding, send_path = _pick_encoding(full_path)
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        resp = send_file(
+            send_path,
+            mimetype=mimetype,
+            max_age=app.get_send_file_max_age(filename),
+            conditional=True,
+        )
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        if any(os.path.isfile(full_path + s) for _, s in PRECOMPRESSED):
+            resp.vary.add("Accept-Encoding")
+
+        if not app.debug and _is_fingerprinted(filename):
+            resp.cache_control.no_cache = None
+            resp.cache_control.public = True
+            resp.cache_control.max_age = ONE_YEAR
+            resp.cache_control.immutable = True
+        return resp
+
+    app.view_functions["static"] = serve_static
+
+
+if __name__ == "__main__":
+    from config import BASE_DIR
+
+    static_dir = os.path.join(BASE_DIR, "static")
+    if sys.argv[1:] == ["compress"]:
+        print(f"{precompress_static(static_dir)} precompressed files written")
+    else:
+        for path, digest in sorted(build_manifest(static_dir).items()):
+            print(digest, path)
@@ -0,0 +1,199 @@
+import hashlib
+import os
+import threading
+
+from flask import url_for
+
+from config import BASE_DIR
+from database.catalog_version import on_catalog_change
+from models.models import ImageVariant
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # без Pillow отдаём только оригиналы
+    Image = None
+
+VARIANT_WIDTHS = (160, 320, 640, 1280)
+VARIANT_FORMATS = ("webp", "jpeg")
+VARIANTS_DIR = "uploads/variants"
+QUALITY = {"webp": 80, "jpeg": 82}
+
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+
+# source_path -> {format: [(width, path), ...]}; грузится из БД при первом
+# обращении и заново после изменения каталога другим процессом
+_variants = None
+_lock = threading.Lock()
+
+
+def static_rel(path):
+    """Путь относительно static/: в БД встречаются оба вида ("static/uploads/..." и "uploads/...")."""
+    if not path:
+        return ""
+    path = path.strip().replace("\\", "/")
+    return path[7:] if path.startswith("static/") else path
+
+
+def _variant_name(source, width, fmt):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    # одинаковые имена файлов встречаются в разных папках uploads/
+    digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:8]
+    ext = "jpg" if fmt == "jpeg" else fmt
+    return f"{VARIANTS_DIR}/{stem}_{digest}_{width}.{ext}"
+
+
+def _prepare(img, fmt):
+    img = ImageOps.exif_transpose(img)
+    if fmt == "jpeg" and img.mode != "RGB":
+        # прозрачный фон JPEG не поддерживает — кладём на белый
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        rgba = img.convert("RGBA")
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+    if fmt == "webp" and img.mode not in ("RGB", "RGBA"):
+        transparent = img.mode in ("LA", "PA", "P") or "transparency" in img.info
+        return img.convert("RGBA" if transparent else "RGB")
+    return img
+
+
+def generate_variants(db, path):
+    """
+    Создаёт уменьшенные копии изображения (WebP и JPEG, без EXIF)
+    и записывает их в image_variants. Коммит — на вызывающей стороне.
+    """
+    source = static_rel(path)
+    if Image is None or not source:
+        return []
+
+    full = os.path.join(STATIC_DIR, source)
+    if not os.path.exists(full):
+        return []
+    delete_variants(db, source)
+    try:
+        with Image.open(full) as original:
+            original.load()
+            orig_width = original.width
+            created = []
+            widths = [w for w in VARIANT_WIDTHS if w < orig_width] or [orig_width]
+            os.makedirs(os.path.join(STATIC_DIR, VARIANTS_DIR), exist_ok=True)
+            for fmt in VARIANT_FORMATS:
+                img = _prepare(original, fmt)
+                for width in widths:
+                    height = max(1, round(img.height * width / img.width))
+                    resized = img.resize((width, height), Image.LANCZOS)
+                    rel = _variant_name(source, width, fmt)
+                    resized.save(
+                        os.path.join(STATIC_DIR, rel),
+                        fmt.upper(),
+                        quality=QUALITY[fmt],
+                        optimize=True,
+                        exif=b"",
+                    )
+                    created.append(
+                        ImageVariant(
+                            source_path=source, width=width, format=fmt, path=rel
+                        )
+                    )
+    except Exception as e:
+        print("Cannot generate image variants:", source, e)
+        return []
+
+    db.add_all(created)
+    with _lock:
+        if _variants is not None:
+            _variants[source] = _group(created)
+    return created
+
+
+def delete_variants(db, path):
+    """Удаляет файлы и записи вариантов для оригинала."""
+    source = static_rel(path)
+    if not source:
+        return
+    for v in db.query(ImageVariant).filter(ImageVariant.source_path == source).all():
+        try:
+            full = os.path.join(STATIC_DIR, v.path)
+            if os.path.exists(full):
+                os.remove(full)
+        except Exception as e:
+            print("Cannot delete image variant file:", e)
+        db.delete(v)
+    with _lock:
+        if _variants is not None:
+            _variants.pop(source, None)
+
+
+def _group(rows):
+    grouped = {}
+    for v in rows:
+        grouped.setdefault(v.format, []).append((v.width, v.path))
+    for items in grouped.values():
+        items.sort()
+    return grouped
+
+
+def _load_variants():
+    global _variants
+    if _variants is not None:
+        return _variants
+    from initdb import ReadSessionLocal
+
+    db = ReadSessionLocal()
+    try:
+        rows = db.query(ImageVariant).all()
+    finally:
+        db.close()
+    by_source = {}
+    for v in rows:
+        by_source.setdefault(v.source_path, []).append(v)
+    with _lock:
+        if _variants is None:
+            _variants = {s: _group(vs) for s, vs in by_source.items()}
+        return _variants
+
+
+@on_catalog_change
+def invalidate_variants():
+    global _variants
+    with _lock:
+        _variants = None
+
+
+def image_srcset(path, fmt="jpeg"):
+    """Значение атрибута srcset для оригинала; пустая строка, если вариантов нет."""
+    source = static_rel(path)
+    if not source or source.startswith(("http://", "https://")):
+        return ""
+    items = _load_variants().get(source, {}).get(fmt, [])
+    return ", ".join(
+        f"{url_for('static', filename=p)} {w}w" for w, p in items
+    )
+
+
+def backfill_variants():
+    """Генерирует варианты для всех уже загруженных изображений."""
+    from initdb import SessionLocal
+    from models.models import AddOnItem, Category, Product, ProductImage
+
+    db = SessionLocal()
+    try:
+        paths = set()
+        paths.update(p for (p,) in db.query(Product.preview) if p)
+        paths.update(p for (p,) in db.query(ProductImage.path) if p)
+        paths.update(p for (p,) in db.query(Category.image_path) if p)
+        paths.update(p for (p,) in db.query(AddOnItem.image_path) if p)
+        for path in sorted(paths):
+            if static_rel(path).startswith(("http://", "https://")):
+                continue
+            created = generate_variants(db, path)
+            print(f"{path}: {len(created)} variants")
+        db.commit()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    from initdb import init_db
+
+    init_db()
+    backfill_variants()
@@ -0,0 +1,160 @@
+import json
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, or_, select, update
+from sqlalchemy.orm import Session
+
+from config import JOB_HOST, JOB_POLL_INTERVAL, JOB_WORKERS
+from initdb import SessionLocal, engine
+from models.models import Job
+
+MAX_ATTEMPTS = 3
+# задача в статусе running дольше этого считается брошенной (упал процесс)
+STALE_AFTER = timedelta(minutes=10)
+
+_handlers = {}
+_wake = threading.Event()
+_workers = []
+_start_lock = threading.Lock()
+
+
+def job_handler(kind):
+    """Регистрирует обработчик: fn(db, payload). Коммит делает воркер."""
+
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+
+    return register
+
+
+def enqueue(db, kind, payload, host=None):
+    """
+    Ставит задачу в очередь в рамках текущей транзакции:
+    воркеры увидят её только после db.commit().
+    host — выполнить только на этом хосте (задача работает с его файлами).
+    """
+    job = Job(kind=kind, payload=json.dumps(payload, ensure_ascii=False), host=host)
+    db.add(job)
+    db.info["jobs_enqueued"] = True
+    return job
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_on_commit(session):
+    if session.info.pop("jobs_enqueued", False):
+        _wake.set()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+def _claim():
+    """Атомарно забирает самую старую задачу из очереди (общую или этого хоста)."""
+    now = datetime.utcnow()
+    oldest = (
+        select(Job.id)
+        .where(Job.status == "queued", or_(Job.host.is_(None), Job.host == JOB_HOST))
+        .order_by(Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)  # PostgreSQL; SQLite игнорирует
+        .scalar_subquery()
+    )
+    stmt = (
+        update(Job)
+        .where(Job.id == oldest, Job.status == "queued")
+        .values(
+            status="running",
+            locked_at=now,
+            updated_at=now,
+            attempts=Job.attempts + 1,
+        )
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts)
+    )
+    with engine.begin() as conn:
+        return conn.execute(stmt).first()
+
+
+def _finish(job_id, status, error=None):
+    with engine.begin() as conn:
+        conn.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(
+                status=status,
+                error=error,
+                locked_at=None,
+                updated_at=datetime.utcnow(),
+            )
+        )
+
+
+def requeue_stale_jobs():
+    cutoff = datetime.utcnow() - STALE_AFTER
+    with engine.begin() as conn:
+        conn.execute(
+            update(Job)
+            .where(Job.status == "running", Job.locked_at < cutoff)
+            .values(status="queued", locked_at=None)
+        )
+
+
+def run_job(row):
+    handler = _handlers.get(row.kind)
+    if handler is None:
+        _finish(row.id, "failed", f"unknown job kind: {row.kind}")
+        return
+
+    db = SessionLocal()
+    try:
+        handler(db, json.loads(row.payload or "{}"))
+        db.commit()
+    except Exception:
+        db.rollback()
+        error = traceback.format_exc()
+        print(f"Job {row.id} ({row.kind}) failed:", error)
+        status = "failed" if row.attempts >= MAX_ATTEMPTS else "queued"
+        _finish(row.id, status, error)
+        return
+    finally:
+        db.close()
+    _finish(row.id, "done")
+
+
+def run_pending():
+    """Выполняет все задачи из очереди в текущем потоке (для скриптов и отладки)."""
+    while True:
+        row = _claim()
+        if row is None:
+            return
+        run_job(row)
+
+
+def _worker_loop():
+    while True:
+        try:
+            row = _claim()
+        except Exception as e:
+            print("Job queue error:", e)
+            row = None
+        if row is None:
+            _wake.wait(JOB_POLL_INTERVAL)
+            _wake.clear()
+            continue
+        run_job(row)
+
+
+def start_workers(count=JOB_WORKERS):
+    """Запускает пул фоновых потоков-воркеров (один раз на процесс)."""
+    with _start_lock:
+        if _workers:
+            return
+        requeue_stale_jobs()
+        for i in range(count):
+            t = threading.Thread(target=_worker_loop, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
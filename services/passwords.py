@@ -0,0 +1,159 @@
+"""
+Хэширование паролей вне потоков запросов: generate/check_password_hash
+выполняются в ограниченном пуле процессов, параметры (алгоритм и стоимость)
+задаются в config.PASSWORD_HASH_METHOD. Хэш со старыми параметрами
+пересчитывается при успешном входе (см. auth.login).
+
+    python -m services.passwords bench [метод] [секунд]   # хэшей/с на ядро
+"""
+
+import multiprocessing
+import os
+from functools import lru_cache
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config import (
+    PASSWORD_HASH_MAX_PENDING,
+    PASSWORD_HASH_METHOD,
+    PASSWORD_HASH_TIMEOUT,
+    PASSWORD_HASH_WORKERS,
+)
+
+
+class HasherBusy(Exception):
+    """Очередь на хэширование переполнена — запрос лучше отклонить."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# сколько задач может ждать пул; остальные получают HasherBusy
+_slots = threading.BoundedSemaphore(max(1, PASSWORD_HASH_MAX_PENDING))
+
+
+def _noop():
+    return None
+
+
+def _init_worker():
+    from initdb import dispose_after_fork
+
+    dispose_after_fork()
+
+
+def init_password_hasher():
+    """
+    Запускает процессы пула. Вызывать при старте — до фоновых потоков и до
+    первых соединений с БД: процессы создаются через fork. spawn/forkserver
+    не подходят — дочерний процесс заново выполнил бы main.py (init_db,
+    воркеры очереди). Унаследованные пулы соединений дочерний процесс
+    на всякий случай сбрасывает (_init_worker).
+    """
+    global _pool
+    if PASSWORD_HASH_WORKERS <= 0:
+        return
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_worker,
+            )
+            _pool.submit(_noop).result()
+
+
+def _run(fn, *args):
+    global _pool
+    if _pool is None:
+        # пул выключен (PASSWORD_HASH_WORKERS = 0) или не запущен — в текущем потоке
+        return fn(*args)
+    if not _slots.acquire(timeout=PASSWORD_HASH_TIMEOUT):
+        raise HasherBusy()
+    try:
+        future = _pool.submit(fn, *args)
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except FutureTimeoutError:
+        # пул не успел (очередь длиннее, чем он успевает) — отказ, а не 500
+        future.cancel()
+        raise HasherBusy()
+    except BrokenProcessPool:
+        # процесс пула убит (OOM и т.п.): считаем здесь, пул больше не используем
+        print("Password hasher pool is broken, hashing inline")
+        _pool = None
+        return fn(*args)
+    finally:
+        _slots.release()
+
+
+def hash_password(password, method=PASSWORD_HASH_METHOD):
+    return _run(generate_password_hash, password, method)
+
+
+def verify_password(hashed, password):
+    return _run(check_password_hash, hashed, password)
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    """
+    Префикс, который werkzeug пишет в хэш для method: "scrypt" превращается
+    в "scrypt:32768:8:1", "pbkdf2:sha256" — в "pbkdf2:sha256:<итерации>".
+    """
+    return generate_password_hash("x", method).split("$", 1)[0]
+
+
+def needs_rehash(hashed, method=PASSWORD_HASH_METHOD):
+    """True, если хэш посчитан с другими параметрами, чем в конфиге."""
+    return hashed.split("$", 1)[0] != _method_prefix(method)
+
+
+# ---- бенчмарк ----
+
+
+def _hash_n(method, n):
+    for _ in range(n):
+        generate_password_hash("benchmark-Passw0rd", method)
+    return n
+
+
+def bench(method=PASSWORD_HASH_METHOD, seconds=5.0):
+    cores = os.cpu_count() or 1
+    workers = PASSWORD_HASH_WORKERS if PASSWORD_HASH_WORKERS > 0 else cores
+
+    start = time.perf_counter()
+    single = 0
+    while time.perf_counter() - start < seconds:
+        single += _hash_n(method, 1)
+    single_rate = single / (time.perf_counter() - start)
+    print(f"{method}: {1000 / single_rate:.1f} ms/хэш, {single_rate:.1f} хэшей/с на ядро")
+
+    # пул: по пачке на процесс, чтобы мерить хэширование, а не пересылку задач
+    batch = max(1, int(single_rate * seconds / 2))
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("fork")
+    ) as pool:
+        pool.submit(_noop).result()
+        start = time.perf_counter()
+        total = sum(pool.map(_hash_n, [method] * workers, [batch] * workers))
+        rate = total / (time.perf_counter() - start)
+    print(
+        f"пул из {workers} процессов ({cores} ядер): {rate:.1f} хэшей/с, "
+        f"{rate / min(workers, cores):.1f} на ядро"
+    )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] != ["bench"]:
+        print(__doc__)
+        sys.exit(1)
+    bench(
+        args[1] if len(args) > 1 else PASSWORD_HASH_METHOD,
+        float(args[2]) if len(args) > 2 else 5.0,
+    )
@@ -0,0 +1,481 @@
+"""
+Сессии на стороне сервера: в cookie лежит только случайный id, данные
+(user_id, снимок профиля, флаги админки) — в хранилище с интерфейсом Redis
+(get/set ex=/delete/expire/sadd/srem/smembers). Данные читаются из хранилища
+при первом обращении к session, а не на каждый запрос: публичные страницы и
+ответы 304 хранилище не трогают. Гостевая корзина сюда не попадает — она в
+подписанной cookie (database/guest_cart.py).
+Хранилище выбирает config.SESSION_BACKEND: по умолчанию SqlStore — таблицы в
+БД, общие для всех процессов; MemoryStore — в памяти процесса (тесты, один
+процесс); Redis — по SESSION_REDIS_URL (нужен пакет redis). Истёкшие записи
+удаляет фоновая очистка.
+"""
+
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from flask import current_app, session
+from flask.sessions import SecureCookieSession, SessionInterface, session_json_serializer
+
+from sqlalchemy import delete, distinct, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import (
+    SESSION_BACKEND,
+    SESSION_DATABASE_URL,
+    SESSION_REDIS_URL,
+    SESSION_SWEEP_INTERVAL,
+    SESSION_TTL,
+)
+from models.models import Base, SessionEntry, SessionMember
+
+try:
+    import redis
+except ImportError:  # без redis — только хранилище в памяти
+    redis = None
+
+KEY_PREFIX = "session:"
+USER_SESSIONS_PREFIX = "user_sessions:"
+# TTL сессии продлевается не на каждый запрос, а когда прошла эта доля срока
+REFRESH_FRACTION = 0.5
+
+
+class _SweepingStore(ABC):
+    """Фоновый поток, раз в sweep_interval секунд вызывающий sweep()."""
+
+    def __init__(self, sweep_interval=SESSION_SWEEP_INTERVAL):
+        self._lock = threading.Lock()
+        self._sweep_interval = sweep_interval
+        self._sweeper = None
+
+    @abstractmethod
+    def sweep(self):
+        """Удаляет истёкшие ключи; возвращает их число."""
+
+    def _start_sweeper(self):
+        if self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop, name="session-sweeper", daemon=True
+            )
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self._sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print("Session sweep error:", e)
+
+
+class MemoryStore(_SweepingStore):
+    """Минимальная замена Redis в памяти процесса: строки и множества с TTL."""
+
+    def __init__(self, sweep_interval=SESSION_SWEEP_INTERVAL):
+        super().__init__(sweep_interval)
+        self._data = {}  # ключ -> (значение, момент истечения или None)
+
+    def _live(self, name):
+        entry = self._data.get(name)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[name]
+            return None
+        return entry
+
+    def get(self, name):
+        with self._lock:
+            entry = self._live(name)
+            return None if entry is None else entry[0]
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._data[name] = (value, time.monotonic() + ex if ex else None)
+        self._start_sweeper()
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(n, None) is not None for n in names)
+
+    def expire(self, name, time_):
+        with self._lock:
+            entry = self._live(name)
+            if entry is None:
+                return False
+            self._data[name] = (entry[0], time.monotonic() + time_)
+            return True
+
+    def sadd(self, name, *values):
+        with self._lock:
+            entry = self._live(name)
+            members = entry[0] if entry else set()
+            before = len(members)
+            members.update(values)
+            self._data[name] = (members, entry[1] if entry else None)
+            return len(members) - before
+
+    def srem(self, name, *values):
+        with self._lock:
+            entry = self._live(name)
+            if entry is None:
+                return 0
+            before = len(entry[0])
+            entry[0].difference_update(values)
+            return before - len(entry[0])
+
+    def smembers(self, name):
+        with self._lock:
+            entry = self._live(name)
+            return set(entry[0]) if entry else set()
+
+    def sweep(self):
+        """Удаляет истёкшие ключи; возвращает их число."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]
+            for k in expired:
+                del self._data[k]
+        return len(expired)
+
+
+class SqlStore(_SweepingStore):
+    """
+    То же поверх таблиц session_entries и session_members: сессии видны всем
+    процессам и переживают перезапуск. Время истечения — unix-секунды.
+    Движок отдельный: записи сессий не должны считаться записями в основную
+    БД, иначе чтения каталога уходили бы с реплик (REPLICA_READ_AFTER_WRITE).
+    """
+
+    def __init__(self, url=SESSION_DATABASE_URL, sweep_interval=SESSION_SWEEP_INTERVAL):
+        from initdb import make_engine
+
+        super().__init__(sweep_interval)
+        self.engine = make_engine(url)
+        self._dialect = postgresql if self.engine.dialect.name == "postgresql" else sqlite
+
+    def create_tables(self):
+        Base.metadata.create_all(
+            self.engine, tables=[SessionEntry.__table__, SessionMember.__table__]
+        )
+
+    @staticmethod
+    def _alive(column):
+        return or_(column.is_(None), column > time.time())
+
+    def get(self, name):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(SessionEntry.value).where(
+                    SessionEntry.key == name, self._alive(SessionEntry.expires_at)
+                )
+            ).scalar()
+
+    def set(self, name, value, ex=None):
+        stmt = self._dialect.insert(SessionEntry).values(
+            key=name, value=value, expires_at=time.time() + ex if ex else None
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SessionEntry.key],
+            set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+        )
+        with self.engine.begin() as conn:
+            conn.execute(stmt)
+        self._start_sweeper()
+        return True
+
+    def delete(self, *names):
+        with self.engine.begin() as conn:
+            sets = conn.execute(
+                select(func.count(distinct(SessionMember.key))).where(
+                    SessionMember.key.in_(names)
+                )
+            ).scalar()
+            conn.execute(delete(SessionMember).where(SessionMember.key.in_(names)))
+            entries = conn.execute(
+                delete(SessionEntry).where(SessionEntry.key.in_(names))
+            ).rowcount
+        return entries + sets
+
+    def expire(self, name, time_):
+        expires_at = time.time() + time_
+        with self.engine.begin() as conn:
+            changed = 0
+            for model in (SessionEntry, SessionMember):
+                changed += conn.execute(
+                    update(model)
+                    .where(model.key == name, self._alive(model.expires_at))
+                    .values(expires_at=expires_at)
+                ).rowcount
+        return changed > 0
+
+    def sadd(self, name, *values):
+        with self.engine.begin() as conn:
+            conn.execute(
+                delete(SessionMember).where(
+                    SessionMember.key == name, ~self._alive(SessionMember.expires_at)
+                )
+            )
+            # новые элементы живут столько же, сколько уже имеющиеся
+            expires_at = conn.execute(
+                select(func.max(SessionMember.expires_at)).where(SessionMember.key == name)
+            ).scalar()
+            stmt = self._dialect.insert(SessionMember).on_conflict_do_nothing(
+                index_elements=[SessionMember.key, SessionMember.member]
+            )
+            return conn.execute(
+                stmt,
+                [{"key": name, "member": v, "expires_at": expires_at} for v in values],
+            ).rowcount
+
+    def srem(self, name, *values):
+        with self.engine.begin() as conn:
+            return conn.execute(
+                delete(SessionMember).where(
+                    SessionMember.key == name, SessionMember.member.in_(values)
+                )
+            ).rowcount
+
+    def smembers(self, name):
+        with self.engine.connect() as conn:
+            return set(
+                conn.execute(
+                    select(SessionMember.member).where(
+                        SessionMember.key == name, self._alive(SessionMember.expires_at)
+                    )
+                ).scalars()
+            )
+
+    def sweep(self):
+        """Удаляет истёкшие записи; возвращает их число."""
+        now = time.time()
+        with self.engine.begin() as conn:
+            return sum(
+                conn.execute(
+                    delete(model).where(model.expires_at <= now)
+                ).rowcount
+                for model in (SessionEntry, SessionMember)
+            )
+
+
+def make_store():
+    if SESSION_BACKEND == "redis":
+        if redis is None:
+            raise RuntimeError("SESSION_BACKEND = redis, но пакет redis не установлен")
+        return redis.Redis.from_url(SESSION_REDIS_URL)
+    if SESSION_BACKEND == "memory":
+        return MemoryStore()
+    if SESSION_BACKEND == "sql":
+        return SqlStore()
+    raise RuntimeError(f"Неизвестный SESSION_BACKEND: {SESSION_BACKEND!r}")
+
+
+store = make_store()
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class ServerSession(SecureCookieSession):
+    """
+    Та же сессия Flask (modified/accessed), плюс id записи в хранилище.
+    С loader данные подгружаются при первом обращении к любому ключу.
+    """
+
+    def __init__(self, initial=None, sid=None, loader=None):
+        super().__init__(initial)
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.old_sid = None
+        self.loaded_at = None
+        self._loader = loader
+
+    @property
+    def loaded(self):
+        return self._loader is None
+
+    def _load(self):
+        loader, self._loader = self._loader, None
+        if loader is None:
+            return
+        data = loader(self.sid)
+        if data is None:
+            # id истёк или выдуман клиентом — не переиспользуем его
+            self.sid = secrets.token_urlsafe(32)
+            return
+        self.loaded_at = data.pop("_saved_at", None)
+        dict.update(self, data)  # без on_update: загрузка — не изменение
+
+    def regenerate(self):
+        """Новый id (после входа — защита от фиксации сессии)."""
+        self._load()
+        if self.old_sid is None:
+            self.old_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+def _loading(name):
+    method = getattr(SecureCookieSession, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._load()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+# любое чтение или запись сначала подгружает данные из хранилища
+for _name in (
+    "__getitem__",
+    "__setitem__",
+    "__delitem__",
+    "__contains__",
+    "__iter__",
+    "__len__",
+    "__eq__",
+    "__repr__",
+    "get",
+    "keys",
+    "values",
+    "items",
+    "copy",
+    "setdefault",
+    "pop",
+    "popitem",
+    "update",
+    "clear",
+):
+    setattr(ServerSession, _name, _loading(_name))
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = session_json_serializer
+
+    def __init__(self, store):
+        self.store = store
+
+    def _ttl(self, app, s):
+        if s.permanent:
+            return int(app.permanent_session_lifetime.total_seconds())
+        return SESSION_TTL
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            return ServerSession(sid=sid, loader=self._load)
+        return ServerSession()
+
+    def _load(self, sid):
+        raw = self.store.get(KEY_PREFIX + sid)
+        return None if raw is None else self.serializer.loads(_decode(raw))
+
+    def save_session(self, app, s, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if s.old_sid is not None:
+            self.store.delete(KEY_PREFIX + s.old_sid)
+
+        if not s.loaded:
+            return  # к сессии в этом запросе не обращались
+
+        if not s:
+            if s.modified:
+                self.store.delete(KEY_PREFIX + s.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        ttl = self._ttl(app, s)
+        now = time.time()
+        stale = s.loaded_at is None or now - s.loaded_at > ttl * REFRESH_FRACTION
+        if not (s.modified or stale):
+            return
+
+        self.store.set(
+            KEY_PREFIX + s.sid, self.serializer.dumps({**s, "_saved_at": now}), ex=ttl
+        )
+        response.set_cookie(
+            name,
+            s.sid,
+            expires=self.get_expiration_time(app, s),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+        response.vary.add("Cookie")
+
+
+def init_session_store(app):
+    if isinstance(store, SqlStore):
+        store.create_tables()
+    app.session_interface = ServerSessionInterface(store)
+
+
+# ---- пользователь в сессии ----
+
+
+def profile_snapshot(user):
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "phone": user.phone,
+    }
+
+
+def login_user(user, permanent=False):
+    """Вход: новый id сессии, снимок профиля, сессия в списке сессий пользователя."""
+    session.regenerate()
+    session["user_id"] = user.id
+    session["user"] = profile_snapshot(user)
+    session.permanent = permanent
+    key = USER_SESSIONS_PREFIX + str(user.id)
+    store.sadd(key, session.sid)
+    lifetime = current_app.permanent_session_lifetime.total_seconds()
+    store.expire(key, int(max(SESSION_TTL, lifetime)))
+
+
+def revoke_user_sessions(user_id):
+    """Завершает все сессии пользователя во всех процессах (выход везде)."""
+    key = USER_SESSIONS_PREFIX + str(user_id)
+    sids = [_decode(sid) for sid in store.smembers(key)]
+    if sids:
+        store.delete(*(KEY_PREFIX + sid for sid in sids))
+    store.delete(key)
+
+
+def logout_user(everywhere=False):
+    """Выход: сессия удаляется; everywhere=True — и все другие сессии пользователя."""
+    user_id = session.get("user_id")
+    if user_id is not None:
+        if everywhere:
+            revoke_user_sessions(user_id)
+        else:
+            store.srem(USER_SESSIONS_PREFIX + str(user_id), session.sid)
+    session.clear()
+
+
+def current_profile():
+    """Снимок профиля из сессии; для старых сессий без снимка — один запрос в БД."""
+    profile = session.get("user")
+    if profile is None:
+        from initdb import db_session
+        from models.models import User
+
+        user = db_session().get(User, session["user_id"])
+        if user is None:
+            return None
+        profile = session["user"] = profile_snapshot(user)
+    return profile
@@ -0,0 +1,206 @@
+"""
+Подсказки при вводе (/api/suggest): префиксный индекс в памяти по названиям
+товаров и категорий. Индекс — отсортированный список ключей, поиск — bisect;
+БД читается только при первой сборке. Изменения товаров и категорий
+применяются к индексу после commit (названия берутся из сессии при flush);
+изменения из других процессов — сбросом через on_catalog_change.
+"""
+
+import re
+import threading
+from bisect import bisect_left
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database.catalog_version import on_catalog_change
+from models.models import Category, Product
+
+MAX_SUGGESTIONS = 10
+# кандидатов до сортировки по качеству совпадения
+MAX_CANDIDATES = 50
+
+# украинская транслитерация (+ русские буквы), сразу в «сложенном» виде:
+# х -> h, и/й -> i, чтобы совпадать с латиницей, набранной как слышится
+_CYR = {
+    "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "g", "д": "d", "е": "e",
+    "є": "ie", "ж": "zh", "з": "z", "и": "i", "і": "i", "ї": "i", "й": "i",
+    "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts", "ч": "ch",
+    "ш": "sh", "щ": "shch", "ь": "", "ю": "iu", "я": "ia", "ы": "i",
+    "э": "e", "ъ": "", "ё": "e",
+}  # fmt: skip
+_TRANSLIT = str.maketrans(_CYR)
+# латиница к тем же формам: kh/x -> h, y -> i, c (кроме ch) -> k, w -> v, ph -> f
+_LATIN_FOLDS = (
+    (re.compile(r"kh"), "h"),
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"c(?!h)"), "k"),
+    (re.compile(r"y"), "i"),
+    (re.compile(r"w"), "v"),
+    (re.compile(r"q"), "k"),
+    (re.compile(r"x"), "ks"),
+)
+_APOSTROPHES_RE = re.compile(r"['’ʼ`]")
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """Регистр, апострофы, транслитерация: «М'який» и «myakyi» -> одна форма."""
+    text = _APOSTROPHES_RE.sub("", (text or "").lower())
+    text = _NON_WORD_RE.sub(" ", text)
+    # латинские правила применяются к исходной латинице, не к транслиту
+    for pattern, repl in _LATIN_FOLDS:
+        text = pattern.sub(repl, text)
+    return " ".join(text.translate(_TRANSLIT).split())
+
+
+def _keys(ref, name):
+    words = normalize(name).split()
+    return [(" ".join(words[pos:]), pos, ref) for pos in range(len(words))]
+
+
+class PrefixIndex:
+    """
+    Неизменяемый снимок: ключи — нормализованное название, начиная с каждого
+    слова («шафа доні» -> «шафа доні», «доні»), чтобы находить и по второму слову.
+    """
+
+    def __init__(self, entries, keys=None):
+        # entries: {(kind, id): name}
+        self.entries = entries
+        if keys is None:
+            keys = sorted(k for ref, name in entries.items() for k in _keys(ref, name))
+        self.keys = keys
+        self._key_strings = [k[0] for k in keys]
+
+    def search(self, q, limit=MAX_SUGGESTIONS):
+        q = normalize(q)
+        if not q:
+            return []
+        found = {}
+        i = bisect_left(self._key_strings, q)
+        while i < len(self.keys) and len(found) < MAX_CANDIDATES:
+            key, pos, ref = self.keys[i]
+            if not key.startswith(q):
+                break
+            if ref not in found or pos < found[ref]:
+                found[ref] = pos
+            i += 1
+        # сначала совпадения с начала названия, категории раньше товаров, короче — выше
+        ranked = sorted(
+            found.items(),
+            key=lambda item: (
+                item[1],
+                item[0][0] != "category",
+                len(self.entries[item[0]]),
+            ),
+        )
+        return [(kind, id_, self.entries[(kind, id_)]) for (kind, id_), _ in ranked[:limit]]
+
+    def updated(self, changes):
+        """
+        Новый снимок с изменениями {(kind, id): name или None (удалён)}:
+        нормализуются только изменённые названия, остальные ключи переиспользуются.
+        """
+        entries = dict(self.entries)
+        added = []
+        for ref, name in changes.items():
+            if name:
+                entries[ref] = name
+                added.extend(_keys(ref, name))
+            else:
+                entries.pop(ref, None)
+        keys = [k for k in self.keys if k[2] not in changes]
+        # timsort сливает два отсортированных куска почти за линейное время
+        keys.extend(sorted(added))
+        keys.sort()
+        return PrefixIndex(entries, keys)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _load_index():
+    from initdb import ReadSessionLocal
+
+    db = ReadSessionLocal()
+    try:
+        entries = {("product", id_): name for id_, name in db.query(Product.id, Product.name)}
+        entries.update(
+            {("category", id_): name for id_, name in db.query(Category.id, Category.name)}
+        )
+    finally:
+        db.close()
+    return PrefixIndex(entries)
+
+
+def get_index():
+    global _index
+    index = _index
+    if index is None:
+        with _lock:
+            if _index is None:
+                _index = _load_index()
+            index = _index
+    return index
+
+
+def suggest(q, limit=MAX_SUGGESTIONS):
+    """[(kind, id, name)], kind — "product" или "category"."""
+    return get_index().search(q, limit)
+
+
+@on_catalog_change
+def invalidate_suggest_index():
+    global _index
+    with _lock:
+        _index = None
+
+
+# ---- синхронизация с БД ----
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    changes = None
+    for objects, deleted in (
+        (session.new, False),
+        (session.dirty, False),
+        (session.deleted, True),
+    ):
+        for obj in objects:
+            if isinstance(obj, (Product, Category)):
+                if changes is None:
+                    changes = session.info.setdefault("suggest_changes", {})
+                kind = "product" if isinstance(obj, Product) else "category"
+                changes[(kind, obj.id)] = None if deleted else obj.name
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_changes(orm_execute_state):
+    state = orm_execute_state
+    if state.is_insert or state.is_update or state.is_delete:
+        mapper = state.bind_mapper
+        if mapper is not None and mapper.class_ in (Product, Category):
+            state.session.info["suggest_rebuild"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_on_commit(session):
+    global _index
+    changes = session.info.pop("suggest_changes", None)
+    if session.info.pop("suggest_rebuild", False):
+        invalidate_suggest_index()
+    elif changes:
+        with _lock:
+            # индекс ещё не собран — соберётся из БД с уже новыми данными
+            if _index is not None:
+                _index = _index.updated(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("suggest_changes", None)
+    session.info.pop("suggest_rebuild", None)
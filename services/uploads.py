@@ -0,0 +1,301 @@
+import hashlib
+import os
+from collections import Counter
+from uuid import uuid4
+
+from sqlalchemy import delete, event, inspect, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from werkzeug.utils import secure_filename
+
+from config import ALLOWED_EXT, BASE_DIR, JOB_HOST, UPLOAD_STAGING_FOLDER
+from models.models import AddOnItem, Category, Product, ProductImage, StoredFile
+from services.images import (
+    STATIC_DIR,
+    delete_variants,
+    generate_variants,
+    static_rel,
+)
+from services.jobs import enqueue, job_handler
+
+CAS_DIR = "uploads/cas"
+CHUNK_SIZE = 64 * 1024
+
+# колонки, которые ссылаются на загруженные файлы; refcount меняется только
+# по ним (см. «учёт ссылок» ниже), маршруты сами discard_files не вызывают
+FILE_COLUMNS = {
+    Product: "preview",
+    ProductImage: "path",
+    AddOnItem: "image_path",
+    Category: "image_path",
+}
+
+
+def _is_within_directory(path, directory):
+    path = os.path.realpath(path)
+    directory = os.path.realpath(directory)
+    return os.path.commonpath([path, directory]) == directory
+
+
+def _stream_to_staging(file_storage):
+    """Пишет загрузку во временный файл, попутно считая sha256."""
+    os.makedirs(UPLOAD_STAGING_FOLDER, exist_ok=True)
+    staging_path = os.path.join(UPLOAD_STAGING_FOLDER, uuid4().hex)
+    digest = hashlib.sha256()
+    size = 0
+    with open(staging_path, "wb") as out:
+        while True:
+            chunk = file_storage.stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            out.write(chunk)
+    return staging_path, digest.hexdigest(), size
+
+
+def _add_reference(db, sha256):
+    result = db.execute(
+        update(StoredFile)
+        .where(StoredFile.sha256 == sha256)
+        .values(refcount=StoredFile.refcount + 1)
+        .returning(StoredFile.path)
+    ).first()
+    return result.path if result else None
+
+
+def store_upload(db, file_storage, static_prefix=False):
+    """
+    Кладёт загрузку в контентно-адресуемое хранилище и возвращает путь для БД.
+    Одинаковые файлы хранятся один раз: повторная загрузка лишь увеличивает
+    refcount. Новый файл переносит из временной папки фоновая задача.
+    static_prefix=True — путь вида "static/uploads/..." (так хранят товары),
+    иначе относительно static/ (так хранят категории).
+    """
+    staging_path, sha256, size = _stream_to_staging(file_storage)
+
+    path = _add_reference(db, sha256)
+    if path is None:
+        ext = os.path.splitext(secure_filename(file_storage.filename or ""))[1].lower()
+        if ext.lstrip(".") not in ALLOWED_EXT:
+            ext = ""
+        path = f"{CAS_DIR}/{sha256[:2]}/{sha256}{ext}"
+        try:
+            with db.begin_nested():
+                db.add(StoredFile(sha256=sha256, path=path, size=size, refcount=1))
+        except IntegrityError:
+            # тот же файл только что загрузили параллельно
+            path = _add_reference(db, sha256)
+        else:
+            # при откате транзакции задачи не будет — файл удалит _discard_on_rollback
+            db.info.setdefault("staged_uploads", []).append(staging_path)
+            enqueue(
+                db,
+                "finalize_upload",
+                {
+                    "staging": staging_path,
+                    "dest": os.path.join(STATIC_DIR, path),
+                    "path": path,
+                },
+                # временный файл лежит на диске этого хоста
+                host=JOB_HOST,
+            )
+            staging_path = None
+
+    if staging_path:
+        try:
+            os.remove(staging_path)
+        except OSError:
+            pass
+
+    # ссылку «съест» запись, которой присвоят этот путь; иначе она снимется при commit
+    db.info.setdefault("uploaded_paths", []).append(static_rel(path))
+    return f"static/{path}" if static_prefix else path
+
+
+def retain_files(db, paths):
+    """Добавляет ссылки на уже сохранённые файлы (путь присвоен без загрузки)."""
+    for p in paths:
+        if p:
+            db.execute(
+                update(StoredFile)
+                .where(StoredFile.path == static_rel(p))
+                .values(refcount=StoredFile.refcount + 1)
+            )
+
+
+def discard_files(db, paths):
+    """
+    Снимает ссылки на файлы. Файлы из хранилища удаляются фоновой задачей,
+    когда на них больше никто не ссылается; старые загрузки (до хранилища) —
+    если путь больше не встречается в БД.
+    """
+    legacy = []
+    for p in paths:
+        if not p:
+            continue
+        rel = static_rel(p)
+        result = db.execute(
+            update(StoredFile)
+            .where(StoredFile.path == rel)
+            .values(refcount=StoredFile.refcount - 1)
+            .returning(StoredFile.sha256, StoredFile.refcount)
+        ).first()
+        if result is None:
+            legacy.append(p)
+        elif result.refcount <= 0:
+            enqueue(db, "release_stored_file", {"sha256": result.sha256})
+    if legacy:
+        enqueue(db, "delete_files", {"paths": legacy})
+
+
+# ---- учёт ссылок ----
+# Каждая загрузка (store_upload) даёт +1. При flush собираем, какие пути
+# появились в FILE_COLUMNS и какие исчезли (замена, удаление, в том числе
+# каскадом), а при commit сводим: исчезнувшие — discard_files, загрузки,
+# которые никуда не присвоили, — тоже, пути без загрузки — retain_files.
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+# без active_history присваивание просроченному (после commit) атрибуту не
+# загружает старое значение — и в истории не было бы пути, который заменили
+for _model, _column in FILE_COLUMNS.items():
+    event.listen(getattr(_model, _column), "set", _load_old_value, active_history=True)
+
+
+def _file_ledger(session):
+    return session.info.setdefault(
+        "file_refs", {"added": Counter(), "removed": Counter()}
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_file_refs(session, flush_context):
+    for obj in list(session.new) + list(session.dirty):
+        column = FILE_COLUMNS.get(type(obj))
+        if column is None or obj in session.deleted:
+            continue
+        history = inspect(obj).attrs[column].history
+        if not history.has_changes():
+            continue
+        ledger = _file_ledger(session)
+        ledger["added"].update(static_rel(p) for p in history.added if p)
+        ledger["removed"].update(static_rel(p) for p in history.deleted if p)
+
+
+@event.listens_for(Session, "persistent_to_deleted")
+def _collect_deleted_file_ref(session, instance):
+    column = FILE_COLUMNS.get(type(instance))
+    if column is None:
+        return
+    state = inspect(instance)
+    # значение из БД, даже если перед удалением его успели поменять
+    path = state.committed_state.get(column, state.dict.get(column))
+    if path:
+        _file_ledger(session)["removed"][static_rel(path)] += 1
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_file_refs(session):
+    session.flush()
+    ledger = session.info.pop("file_refs", None)
+    uploaded = Counter(session.info.pop("uploaded_paths", ()))
+    if ledger is None and not uploaded:
+        return
+    added = ledger["added"] if ledger else Counter()
+    removed = ledger["removed"] if ledger else Counter()
+    retain_files(session, list((added - uploaded).elements()))
+    discard_files(
+        session, list(removed.elements()) + list((uploaded - added).elements())
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_staged(session):
+    session.info.pop("staged_uploads", None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    if session.in_nested_transaction():
+        return  # откат savepoint (store_upload) — внешняя транзакция продолжается
+    session.info.pop("file_refs", None)
+    session.info.pop("uploaded_paths", None)
+    # задача finalize_upload откатилась вместе с транзакцией — файл никто не заберёт
+    for staging_path in session.info.pop("staged_uploads", ()):
+        try:
+            os.remove(staging_path)
+        except OSError:
+            pass
+
+
+def _full_path(path):
+    if path.startswith("static/"):
+        return os.path.join(BASE_DIR, path)
+    return os.path.join(STATIC_DIR, static_rel(path))
+
+
+def _remove_file(full):
+    try:
+        if os.path.exists(full) and _is_within_directory(full, STATIC_DIR):
+            os.remove(full)
+    except Exception as e:
+        print("Cannot delete file:", full, e)
+
+
+def _is_referenced(db, path):
+    """Файл ещё используется (например, загружен заново под тем же именем)."""
+    checks = (
+        (Product, Product.preview),
+        (ProductImage, ProductImage.path),
+        (Category, Category.image_path),
+        (AddOnItem, AddOnItem.image_path),
+    )
+    return any(
+        db.query(model.id).filter(column == path).first() is not None
+        for model, column in checks
+    )
+
+
+@job_handler("finalize_upload")
+def finalize_upload(db, payload):
+    staging, dest = payload["staging"], payload["dest"]
+    if not _is_within_directory(dest, STATIC_DIR):
+        raise ValueError(f"upload destination outside static/: {dest}")
+    if os.path.exists(staging):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(staging, dest)
+    elif not os.path.exists(dest):
+        # повтор после переноса — нормально; нет ни временного файла, ни итогового
+        # (задачу взял другой хост, staging почистили) — ошибка, задача повторится
+        raise FileNotFoundError(f"upload is missing: neither {staging} nor {dest} exists")
+    generate_variants(db, payload["path"])
+
+
+@job_handler("release_stored_file")
+def release_stored_file(db, payload):
+    stored = (
+        db.query(StoredFile).filter(StoredFile.sha256 == payload["sha256"]).first()
+    )
+    if stored is None:
+        return
+    # удаляем строку только если ссылок так и не появилось; файл стираем
+    # до коммита, пока транзакция держит блокировку записи
+    deleted = db.execute(
+        delete(StoredFile).where(StoredFile.id == stored.id, StoredFile.refcount <= 0)
+    ).rowcount
+    if deleted:
+        delete_variants(db, stored.path)
+        _remove_file(os.path.join(STATIC_DIR, stored.path))
+
+
+@job_handler("delete_files")
+def delete_files(db, payload):
+    for path in payload["paths"]:
+        if _is_referenced(db, path):
+            continue
+        _remove_file(_full_path(path))
+        delete_variants(db, path)
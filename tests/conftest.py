@@ -0,0 +1,59 @@
+"""
+Общие фикстуры. Переменные окружения задаются до импорта приложения:
+тесты работают со своей временной БД, а не с app.db в корне проекта.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix="furni-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'app.db')}"
+os.environ["SESSION_BACKEND"] = "memory"
+os.environ["PASSWORD_HASH_WORKERS"] = "0"
+os.environ["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:1000"
+
+
+@pytest.fixture(scope="session")
+def app():
+    from main import app as flask_app
+
+    flask_app.config["TESTING"] = True
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    from initdb import SessionLocal
+
+    session = SessionLocal()
+    yield session
+    session.rollback()
+    session.close()
+
+
+@pytest.fixture
+def make_engine(tmp_path):
+    """Отдельная пустая SQLite-БД для теста."""
+    from initdb import make_engine as _make_engine
+
+    engines = []
+
+    def factory(name="test.db"):
+        eng = _make_engine(f"sqlite:///{tmp_path / name}")
+        engines.append(eng)
+        return eng
+
+    yield factory
+    for eng in engines:
+        eng.dispose()
@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from database.cart import add_item, cart_count, merge_items, upsert_cart
+from database.login_keys import add_login_keys
+from database.migrations import run_migrations
+from models.models import Base, CartItem, Product, User
+from services.passwords import hash_password
+
+
+@pytest.fixture
+def cart_db(make_engine):
+    engine = make_engine()
+    # как init_db: таблицы, затем миграции (FTS-индекс поиска и т.п.)
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add_all(
+            [
+                User(id=1, username="u", phone="+380500000001", hashed_password="x"),
+                Product(id=1, name="Стіл", price=100),
+                Product(id=2, name="Стілець", price=50),
+            ]
+        )
+        db.commit()
+    return Session
+
+
+def quantities(db, cart_id):
+    rows = db.query(CartItem.product_id, CartItem.quantity).filter_by(cart_id=cart_id)
+    return dict(rows.all())
+
+
+def test_upsert_cart_returns_the_same_cart(cart_db):
+    with cart_db() as db:
+        first = upsert_cart(db, 1)
+        second = upsert_cart(db, 1)
+        db.commit()
+    assert first == second
+
+
+def test_add_item_inserts_then_increments(cart_db):
+    with cart_db() as db:
+        cart_id = upsert_cart(db, 1)
+        first = add_item(db, cart_id, 1, 2)
+        second = add_item(db, cart_id, 1, 3)
+        db.commit()
+        assert first.id == second.id
+        assert second.quantity == 5
+        assert quantities(db, cart_id) == {1: 5}
+
+
+def test_add_item_for_missing_product_adds_nothing(cart_db):
+    with cart_db() as db:
+        cart_id = upsert_cart(db, 1)
+        assert add_item(db, cart_id, 999, 1) is None
+        assert quantities(db, cart_id) == {}
+
+
+def test_concurrent_adds_do_not_lose_quantity(cart_db):
+    threads, per_thread = 8, 10
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(per_thread):
+                with cart_db() as db:
+                    add_item(db, upsert_cart(db, 1), 1, 1)
+                    db.commit()
+        except Exception as e:  # pragma: no cover - видно в assert ниже
+            errors.append(e)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    assert errors == []
+    with cart_db() as db:
+        assert cart_count(db, 1) == threads * per_thread
+        assert db.query(CartItem).count() == 1
+
+
+def test_merge_items_adds_to_existing_lines(cart_db):
+    with cart_db() as db:
+        cart_id = upsert_cart(db, 1)
+        add_item(db, cart_id, 1, 2)
+        # товара 999 нет в каталоге — он пропускается
+        merge_items(db, cart_id, {1: 3, 2: 1, 999: 4})
+        db.commit()
+        assert quantities(db, cart_id) == {1: 5, 2: 1}
+
+
+@pytest.fixture
+def shopper(db):
+    user = User(
+        username="Покупець",
+        email="shopper@example.com",
+        phone="+380501234567",
+        hashed_password=hash_password("Passw0rd1"),
+    )
+    add_login_keys(user)
+    db.add(user)
+    product = Product(name="Шафа", price=200)
+    db.add(product)
+    db.commit()
+    yield user, product
+    db.delete(user)
+    db.delete(product)
+    db.commit()
+
+
+def test_guest_cart_is_merged_at_login(client, shopper):
+    user, product = shopper
+    response = client.post("/api/cart/add", json={"product_id": product.id, "quantity": 2})
+    assert response.get_json()["cart"]["total_items"] == 2
+    assert client.get_cookie("guest_cart") is not None
+
+    response = client.post(
+        "/login", data={"identifier": "shopper@example.com", "password": "Passw0rd1"}
+    )
+    assert response.status_code == 302
+
+    # гостевая cookie удалена, товары теперь в корзине пользователя в БД
+    assert client.get_cookie("guest_cart") is None
+    assert client.get("/api/cart/count").get_json()["total_items"] == 2
+    client.post("/api/cart/add", json={"product_id": product.id, "quantity": 1})
+    assert client.get("/api/cart/count").get_json()["total_items"] == 3
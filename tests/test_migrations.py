@@ -0,0 +1,68 @@
+import pytest
+from sqlalchemy import inspect, select, text
+
+from database import migrations
+from database.migrations import applied_versions, run_migrations, schema_migrations
+from models.models import Base
+
+
+def recorded(engine):
+    with engine.connect() as conn:
+        return [v for (v,) in conn.execute(select(schema_migrations.c.version))]
+
+
+def test_fresh_database_applies_everything_once(make_engine):
+    engine = make_engine()
+    Base.metadata.create_all(engine)
+
+    applied = run_migrations(engine)
+
+    assert applied == [version for version, _ in migrations.MIGRATIONS]
+    assert applied_versions(engine) == set(applied)
+    assert run_migrations(engine) == []
+
+
+def test_version_claimed_by_another_process_is_skipped(make_engine, monkeypatch):
+    engine = make_engine()
+    calls = []
+    monkeypatch.setattr(migrations, "MIGRATIONS", [("t1", calls.append)])
+    schema_migrations.create(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(schema_migrations.insert().values(version="t1"))
+    # второй процесс успел записать версию после нашей проверки applied_versions
+    monkeypatch.setattr(migrations, "applied_versions", lambda eng: set())
+
+    assert run_migrations(engine) == []
+    assert calls == []
+
+
+def test_failed_migration_is_rolled_back_and_retried(make_engine, monkeypatch):
+    engine = make_engine()
+    calls = []
+
+    def ok(conn):
+        calls.append("ok")
+
+    def broken(conn):
+        conn.execute(text("CREATE TABLE half_done (id INTEGER)"))
+        raise RuntimeError("boom")
+
+    def later(conn):
+        calls.append("later")
+
+    monkeypatch.setattr(
+        migrations, "MIGRATIONS", [("m1", ok), ("m2", broken), ("m3", later)]
+    )
+    with pytest.raises(RuntimeError):
+        run_migrations(engine)
+
+    # запись о версии и изменения схемы откатились вместе
+    assert recorded(engine) == ["m1"]
+    assert "half_done" not in inspect(engine).get_table_names()
+    assert calls == ["ok"]
+
+    monkeypatch.setattr(
+        migrations, "MIGRATIONS", [("m1", ok), ("m2", lambda conn: None), ("m3", later)]
+    )
+    assert run_migrations(engine) == ["m2", "m3"]
+    assert calls == ["ok", "later"]
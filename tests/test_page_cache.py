@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import update
+
+import database.catalog_version as catalog_version
+import services.assets as assets
+from initdb import engine
+from models.models import CatalogState, Category
+
+
+def etag(client, path="/about"):
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.headers["ETag"]
+
+
+def revalidate(client, tag, path="/about"):
+    return client.get(path, headers={"If-None-Match": tag})
+
+
+def test_unchanged_page_revalidates_to_304(client):
+    tag = etag(client)
+    response = revalidate(client, tag)
+    assert response.status_code == 304
+    assert response.headers["ETag"] == tag
+
+
+def test_catalog_write_changes_etag(client, db):
+    tag = etag(client)
+    category = Category(name="Тестова категорія")
+    db.add(category)
+    db.commit()
+    try:
+        response = revalidate(client, tag)
+        assert response.status_code == 200
+        assert response.headers["ETag"] != tag
+    finally:
+        db.delete(category)
+        db.commit()
+
+
+def test_rollback_keeps_etag(client, db):
+    tag = etag(client)
+    db.add(Category(name="Відкат"))
+    db.flush()
+    db.rollback()
+    assert revalidate(client, tag).status_code == 304
+
+
+def test_write_from_another_process_changes_etag(client, monkeypatch):
+    tag = etag(client)
+    dropped = []
+    monkeypatch.setattr(catalog_version, "_listeners", [lambda: dropped.append(True)])
+    # другой процесс увеличил версию в БД, в обход событий этой сессии
+    with engine.begin() as conn:
+        conn.execute(
+            update(CatalogState)
+            .where(CatalogState.id == 1)
+            .values(version=CatalogState.version + 1)
+        )
+    # до следующей проверки процесс ещё отдаёт старую версию
+    assert revalidate(client, tag).status_code == 304
+
+    monkeypatch.setattr(catalog_version, "_checked_at", 0.0)
+    response = revalidate(client, tag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != tag
+    assert dropped == [True]
+
+
+def test_new_deploy_changes_etag_and_last_modified(client, monkeypatch):
+    response = client.get("/about")
+    tag, last_modified = response.headers["ETag"], response.last_modified
+
+    token, modified_at = assets.deploy_token()
+    monkeypatch.setitem(assets._deploy, "token", token + "-next")
+    monkeypatch.setitem(assets._deploy, "modified_at", modified_at + 3600)
+
+    response = revalidate(client, tag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != tag
+    assert response.last_modified > last_modified
+
+
+@pytest.mark.parametrize("encoding", ["gzip", None])
+def test_304_for_each_representation(client, encoding):
+    headers = {"Accept-Encoding": encoding} if encoding else {}
+    response = client.get("/about", headers=headers)
+    tag = response.headers["ETag"]
+    headers["If-None-Match"] = tag
+    assert client.get("/about", headers=headers).status_code == 304
@@ -0,0 +1,56 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import services.passwords as passwords
+from services.passwords import HasherBusy, needs_rehash
+
+
+class StuckPool:
+    """Пул, задачи которого никогда не завершаются."""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+def test_pool_timeout_raises_hasher_busy(monkeypatch):
+    pool = StuckPool()
+    monkeypatch.setattr(passwords, "_pool", pool)
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_TIMEOUT", 0.05)
+
+    with pytest.raises(HasherBusy):
+        passwords.hash_password("Passw0rd1")
+    # задача снята с очереди, слот освобождён
+    assert pool.futures[0].cancelled()
+    assert passwords._slots.acquire(blocking=False)
+    passwords._slots.release()
+
+
+def test_login_answers_503_when_hasher_is_busy(client, monkeypatch):
+    from routers.user_routes import auth
+
+    def busy(*args):
+        raise HasherBusy()
+
+    monkeypatch.setattr(
+        auth, "find_user", lambda db, identifier: SimpleNamespace(hashed_password="x")
+    )
+    monkeypatch.setattr(auth, "verify_password", busy)
+    response = client.post("/login", data={"identifier": "busy@example.com", "password": "x"})
+    assert response.status_code == 503
+
+
+@pytest.mark.parametrize(
+    "method", ["pbkdf2:sha256", "pbkdf2:sha256:1000", "scrypt", "scrypt:16384:8:1"]
+)
+def test_needs_rehash_accepts_bare_and_expanded_methods(method):
+    hashed = generate_password_hash("Passw0rd1", method)
+    assert not needs_rehash(hashed, method)
+    assert needs_rehash(hashed, "pbkdf2:sha256:1")
@@ -0,0 +1,62 @@
+from middlewares import rate_limit
+from middlewares.rate_limit import TokenBuckets, identifier_key
+
+
+def test_bucket_allows_burst_then_refuses(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    buckets = TokenBuckets()
+    limits = [("ip:1", 3, 1.0)]
+
+    assert [buckets.take(limits) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take(limits) == 1.0
+
+    now[0] += 1.0  # пополнился один токен
+    assert buckets.take(limits) == 0
+    assert buckets.take(limits) > 0
+
+
+def test_refusal_does_not_spend_other_buckets(monkeypatch):
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: 1000.0)
+    buckets = TokenBuckets()
+    buckets.take([("id:a", 1, 0.1)])
+
+    # IP-ведро не тратится, если отказало ведро идентификатора
+    assert buckets.take([("ip:1", 1, 0.1), ("id:a", 1, 0.1)]) > 0
+    assert buckets.take([("ip:1", 1, 0.1)]) == 0
+
+
+def test_oldest_buckets_are_evicted():
+    buckets = TokenBuckets(max_keys=2)
+    for key in ("a", "b", "c"):
+        buckets.take([(key, 1, 0.001)])
+    assert list(buckets._buckets) == ["b", "c"]
+
+
+def test_identifier_key_normalizes_phones_and_emails():
+    assert identifier_key("+38 (050) 123-45-67") == identifier_key("380501234567")
+    assert identifier_key(" User@Example.com ") == "id:user@example.com"
+    assert identifier_key("") is None
+
+
+def test_clients_behind_proxy_get_separate_buckets(app, monkeypatch):
+    from werkzeug.middleware.proxy_fix import ProxyFix
+
+    rate_limit.reset_rate_limits()
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_PER_IP", (1, 0.001))
+    monkeypatch.setattr(app, "wsgi_app", ProxyFix(app.wsgi_app, x_for=1))
+    client = app.test_client()
+
+    def attempt(ip):
+        return client.post(
+            "/login",
+            data={"identifier": "", "password": "x"},
+            headers={"X-Forwarded-For": ip},
+        ).status_code
+
+    try:
+        assert attempt("203.0.113.1") != 429
+        assert attempt("203.0.113.1") == 429
+        assert attempt("203.0.113.2") != 429
+    finally:
+        rate_limit.reset_rate_limits()
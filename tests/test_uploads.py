@@ -0,0 +1,123 @@
+import io
+import time
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import services.images as images
+import services.uploads as uploads
+from models.models import AddOnCategory, AddOnItem, Category, Job, Product, StoredFile
+from services.jobs import run_pending
+from services.uploads import store_upload
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch, db):
+    """Загрузки и их перенос — во временную папку, не в static/ проекта."""
+    static_dir = tmp_path / "static"
+    monkeypatch.setattr(uploads, "STATIC_DIR", str(static_dir))
+    monkeypatch.setattr(images, "STATIC_DIR", str(static_dir))
+    monkeypatch.setattr(uploads, "UPLOAD_STAGING_FOLDER", str(tmp_path / "staging"))
+    yield static_dir
+    # фоновые воркеры не должны доделывать задачи после возврата путей
+    deadline = time.monotonic() + 10
+    while db.query(Job).filter(Job.status.in_(["queued", "running"])).count():
+        run_pending()
+        if time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+        db.expire_all()
+
+
+_counter = [0]
+
+
+def upload(db, name="a.jpg"):
+    # каждый вызов — новое содержимое, то есть новый файл в хранилище
+    _counter[0] += 1
+    data = f"file-{_counter[0]}-{time.time_ns()}".encode()
+    return store_upload(db, FileStorage(io.BytesIO(data), filename=name), static_prefix=True)
+
+
+def released(db, path):
+    # строку с refcount 0 могла уже удалить фоновая задача release_stored_file
+    return refcount(db, path) in (0, None)
+
+
+def refcount(db, path):
+    db.expire_all()
+    stored = db.query(StoredFile).filter_by(path=images.static_rel(path)).first()
+    return None if stored is None else stored.refcount
+
+
+def test_assigned_upload_has_one_reference(db, storage):
+    path = upload(db)
+    product = Product(name="P", price=1, preview=path)
+    db.add(product)
+    db.commit()
+    assert refcount(db, path) == 1
+
+    db.delete(product)
+    db.commit()
+    assert released(db, path)
+
+
+def test_unassigned_upload_is_released_at_commit(db, storage):
+    path = upload(db)
+    db.commit()
+    assert released(db, path)
+
+
+def test_replacing_a_preview_releases_the_old_file(db, storage):
+    old = upload(db)
+    product = Product(name="P", price=1, preview=old)
+    db.add(product)
+    db.commit()
+
+    new = upload(db)
+    product.preview = new
+    db.commit()
+    assert released(db, old)
+    assert refcount(db, new) == 1
+
+    db.delete(product)
+    db.commit()
+
+
+def test_cascade_delete_releases_every_file(db, storage):
+    category = Category(name="Каскад", image_path=upload(db, "c.jpg"))
+    product = Product(name="P", price=1, preview=upload(db), category=category)
+    addon = AddOnCategory(name="A", price=1, product=product)
+    item = AddOnItem(name="i", image_path=upload(db), addon_category=addon)
+    db.add(category)
+    db.commit()
+    paths = [category.image_path, product.preview, item.image_path]
+    assert [refcount(db, p) for p in paths] == [1, 1, 1]
+
+    db.delete(category)
+    db.commit()
+    assert all(released(db, p) for p in paths)
+
+
+def test_same_path_on_two_rows_counts_twice(db, storage):
+    path = upload(db)
+    first = Product(name="P1", price=1, preview=path)
+    second = Product(name="P2", price=1, preview=path)
+    db.add_all([first, second])
+    db.commit()
+    assert refcount(db, path) == 2
+
+    db.delete(first)
+    db.commit()
+    assert refcount(db, path) == 1
+    db.delete(second)
+    db.commit()
+
+
+def test_rollback_leaves_no_reference_and_no_staged_file(db, storage, tmp_path):
+    path = upload(db)
+    db.add(Product(name="P", price=1, preview=path))
+    db.flush()
+    db.rollback()
+    assert refcount(db, path) is None
+    assert list((tmp_path / "staging").iterdir()) == []